@@ -0,0 +1,229 @@
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+# Code payloads exercised when no --payloads file is given
+DEFAULT_PAYLOADS = {
+    "hello": 'fn main() { println!("hello from wasm"); }',
+    "loop": 'fn main() { let mut s: u64 = 0; for i in 0..100_000u64 { s = s.wrapping_add(i * i); } println!("{}", s); }',
+}
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = min(max(1, math.ceil(pct / 100.0 * len(sorted_values))), len(sorted_values))
+    return sorted_values[rank - 1]
+
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min": values[0],
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1],
+    }
+
+
+def wait_until_ready(host, port, timeout, process=None):
+    """
+    Polls the server's port until it accepts connections.
+
+    Returns the time waited in seconds. Raises RuntimeError if the server
+    process exits or the timeout passes first.
+    """
+    start = time.monotonic()
+    while True:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode} before becoming ready")
+        try:
+            with socket.create_connection((host, port), timeout=0.2):
+                return time.monotonic() - start
+        except OSError:
+            if time.monotonic() - start > timeout:
+                raise RuntimeError(f"Server at {host}:{port} not ready after {timeout}s")
+            time.sleep(0.02)
+
+
+def make_request(request_id, code, args):
+    return json.dumps({
+        "jsonrpc": "2.0",
+        "method": "execute_code",
+        "params": {
+            "language": "rust",
+            "code": code,
+            "max_fuel": args.max_fuel,
+            "max_memory": args.max_memory,
+            "timeout_ms": args.timeout_ms,
+        },
+        "id": request_id,
+    }).encode()
+
+
+def worker(url, jobs, args, samples, lock):
+    """
+    Sends requests over one persistent keep-alive connection until the
+    shared job iterator is exhausted, reconnecting after errors.
+    """
+    connection = None
+    while True:
+        with lock:
+            job = next(jobs, None)
+        if job is None:
+            break
+        request_id, (name, code) = job
+        body = make_request(request_id, code, args)
+
+        sample = {"payload": name, "ok": False, "fuel_used": None}
+        start = time.perf_counter()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=args.request_timeout)
+            connection.request("POST", url.path or "/", body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            data = json.loads(response.read())
+            result = data.get("result") or {}
+            sample["ok"] = response.status == 200 and "result" in data and result.get("exit_code") == 0
+            sample["fuel_used"] = result.get("fuel_used")
+            sample["timed_out"] = result.get("timed_out")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            sample["error"] = type(e).__name__
+            if connection is not None:
+                connection.close()
+            connection = None
+        sample["latency_ms"] = (time.perf_counter() - start) * 1000.0
+        samples.append(sample)
+
+    if connection is not None:
+        connection.close()
+
+
+def run_load(args, payloads):
+    url = urlparse(args.url)
+    requests_iter = enumerate(
+        itertools.islice(itertools.cycle(sorted(payloads.items())), args.requests), start=1
+    )
+    samples, lock = [], threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(url, requests_iter, args, samples, lock))
+        for _ in range(args.concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [s for s in samples if s["ok"]]
+    report = {
+        "url": args.url,
+        "concurrency": args.concurrency,
+        "requests": len(samples),
+        "succeeded": len(ok),
+        "failed": len(samples) - len(ok),
+        "elapsed_s": elapsed,
+        "requests_per_s": len(samples) / elapsed if elapsed > 0 else None,
+        "latency_ms": summarize([s["latency_ms"] for s in ok]),
+        "payloads": {},
+    }
+    for name in sorted(payloads):
+        mine = [s for s in ok if s["payload"] == name]
+        report["payloads"][name] = {
+            "latency_ms": summarize([s["latency_ms"] for s in mine]),
+            "fuel_used": summarize([s["fuel_used"] for s in mine if s["fuel_used"] is not None]),
+        }
+    return report
+
+
+def main():
+    """
+    Load-tests the lattica-tool-server execute_code RPC.
+
+    1. Optionally starts the server and polls until its port accepts connections.
+    2. Drives the RPC from --concurrency threads, each over a keep-alive connection.
+    3. Reports p50/p95/p99 latency, throughput and fuel_used per payload,
+       and writes the same numbers as JSON for regression tracking.
+    """
+    default_server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lattica-tool-server/target/release/lattica-tool-server")
+    parser = argparse.ArgumentParser(description=main.__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8080/rpc")
+    parser.add_argument("--server", default=None, help=f"Server executable to start (e.g. {default_server}). Omit to test a running server.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--payloads", help="JSON file mapping payload names to Rust source code.")
+    parser.add_argument("--max-fuel", type=int, default=1_000_000)
+    parser.add_argument("--max-memory", type=int, default=16 * 1024 * 1024)
+    parser.add_argument("--timeout-ms", type=int, default=2000)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--ready-timeout", type=float, default=30.0)
+    parser.add_argument("--output", default="load_test_results.json", help="Where to write the JSON report.")
+    parser.add_argument("--max-p99-ms", type=float, help="Exit non-zero if overall p99 latency exceeds this.")
+    args = parser.parse_args()
+
+    payloads = DEFAULT_PAYLOADS
+    if args.payloads:
+        with open(args.payloads) as f:
+            payloads = json.load(f)
+
+    url = urlparse(args.url)
+    server_process = None
+    if args.server:
+        if not os.path.exists(args.server):
+            print(f"Error: Server executable not found at '{args.server}'")
+            print("Please run 'cargo build --release' first.")
+            sys.exit(1)
+        print("--- Starting Lattica Tool Server for load testing ---")
+        server_process = subprocess.Popen([args.server], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        waited = wait_until_ready(url.hostname, url.port or 80, args.ready_timeout, server_process)
+        print(f"--- Server ready after {waited:.2f}s. Sending {args.requests} requests at concurrency {args.concurrency} ---")
+        report = run_load(args, payloads)
+        report["ready_after_s"] = waited
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+
+    latency = report["latency_ms"]
+    print(f"Requests: {report['requests']} ({report['failed']} failed) in {report['elapsed_s']:.2f}s "
+          f"-> {report['requests_per_s']:.1f} req/s")
+    if latency["count"]:
+        print(f"Latency ms: p50={latency['p50']:.2f} p95={latency['p95']:.2f} p99={latency['p99']:.2f}")
+    for name, stats in report["payloads"].items():
+        fuel = stats["fuel_used"]
+        if fuel["count"]:
+            print(f"  {name}: p99={stats['latency_ms']['p99']:.2f} ms, fuel_used p50={fuel['p50']} max={fuel['max']}")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{args.output}'")
+
+    if report["failed"] or (args.max_p99_ms is not None and latency["count"] and latency["p99"] > args.max_p99_ms):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
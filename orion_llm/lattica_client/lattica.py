@@ -1,13 +1,195 @@
+import asyncio
+import hashlib
+import itertools
+import json as jsonlib
+import sqlite3
 import time
 import random
+from collections import OrderedDict
+
+def _complete(prompt):
+    """
+    Returns the canned completion the simulated Orion LLM gives for a prompt.
+    """
+    if "quantum tunneling" in prompt.lower():
+        return "Quantum tunneling is a phenomenon where a particle passes through a potential energy barrier higher than its kinetic energy, which is impossible in classical mechanics."
+    return "This is a generic, simulated response from the Orion LLM."
+
+def _normalize_endpoint(endpoint):
+    """
+    Normalizes an endpoint path so equivalent spellings share cache entries.
+    """
+    parts = [part for part in endpoint.strip().split("/") if part]
+    return "/" + "/".join(parts)
+
+
+class ResponseCache:
+    """
+    An LRU + TTL cache of Lattica responses, bounded by size in bytes.
+
+    Entries are keyed by a SHA-256 of the normalized endpoint and the
+    canonical JSON of the payload, and stored as serialized JSON so every
+    hit returns a fresh copy. With a path, entries are also written through
+    to a SQLite file and survive restarts; disk entries obey the same TTL
+    and byte bound, evicting the least recently used first. Hits served
+    from memory are batched and written to disk before any disk eviction,
+    so both tiers follow one LRU order.
+    """
+    # Memory hits buffered before their used_at times are written to disk
+    TOUCH_BATCH = 256
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=None, path=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (stored_at, serialized)
+        self._bytes = 0
+        self._db = None
+        self._disk_bytes = 0
+        self._touched = {}  # key -> used_at, not yet written to disk
+        if path is not None:
+            self._db = sqlite3.connect(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB, stored_at REAL, used_at REAL, size INTEGER)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+            if self.ttl is not None:
+                self._db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._evict_disk()
+            self._db.commit()
+
+    @staticmethod
+    def make_key(endpoint, payload):
+        canonical = jsonlib.dumps(
+            [_normalize_endpoint(endpoint), payload], sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, endpoint, payload):
+        """
+        Returns the cached response for a request, or None on a miss.
+        """
+        key = self.make_key(endpoint, payload)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry[0], now):
+            self._discard(key)
+            entry = None
+        if entry is not None and self._db is not None:
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+        if entry is None and self._db is not None:
+            entry = self._load(key, now)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return jsonlib.loads(entry[1])
+
+    def put(self, endpoint, payload, response):
+        """
+        Stores a response, evicting least recently used entries as needed.
+        """
+        key = self.make_key(endpoint, payload)
+        serialized = jsonlib.dumps(response, separators=(",", ":")).encode()
+        if len(serialized) > self.max_bytes:
+            return
+        now = time.time()
+        self._store(key, now, serialized)
+        if self._db is not None:
+            self._touched.pop(key, None)
+            self._delete_row(key)
+            self._db.execute(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, now, now, len(serialized)),
+            )
+            self._disk_bytes += len(serialized)
+            self._flush_touched()
+            self._evict_disk()
+            self._db.commit()
+
+    def _store(self, key, stored_at, serialized):
+        self._discard(key)
+        self._entries[key] = (stored_at, serialized)
+        self._bytes += len(serialized)
+        while self._bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _delete_row(self, key):
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _load(self, key, now):
+        row = self._db.execute(
+            "SELECT stored_at, value FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[0], now):
+            self._delete_row(key)
+            self._db.commit()
+            return None
+        self._db.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        self._store(key, row[0], bytes(row[1]))
+        return self._entries[key]
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET used_at = ? WHERE key = ?",
+                [(used_at, key) for key, used_at in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict_disk(self):
+        # Expired rows are dropped when read (and on open); here only the
+        # byte bound is enforced, least recently used first
+        while self._disk_bytes > self.max_bytes:
+            key, size = self._db.execute(
+                "SELECT key, size FROM responses ORDER BY used_at LIMIT 1"
+            ).fetchone()
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._disk_bytes -= size
+            self._discard(key)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._bytes}
+
+    def close(self):
+        if self._db is not None:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
 
 class Client:
     """
     A mock client to simulate interacting with the Lattica P2P network.
+
+    Pass a ResponseCache to answer repeated requests without a round trip.
     """
-    def __init__(self):
+    def __init__(self, cache=None):
         print("[LATTICA] Client initialized. Ready to connect to network.")
         self._is_connected = True
+        self.cache = cache
 
     def post(self, endpoint, json=None):
         """
@@ -16,6 +198,11 @@ class Client:
         if not self._is_connected:
             return {"error": "Not connected to Lattica network."}
 
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, json)
+            if cached is not None:
+                return cached
+
         print(f"[LATTICA] ==> Routing request to endpoint: {endpoint}")
         print(f"[LATTICA] ==> Payload: {json}")
 
@@ -24,10 +211,238 @@ class Client:
 
         # Return a canned response based on the prompt
         prompt = json.get("prompt", "")
-        if "quantum tunneling" in prompt.lower():
-            completion = "Quantum tunneling is a phenomenon where a particle passes through a potential energy barrier higher than its kinetic energy, which is impossible in classical mechanics."
-        else:
-            completion = "This is a generic, simulated response from the Orion LLM."
+        completion = _complete(prompt)
 
         print(f"[LATTICA] <== Response received from peer.")
-        return {"completion": completion}
\ No newline at end of file
+        response = {"completion": completion}
+        if self.cache is not None:
+            self.cache.put(endpoint, json, response)
+        return response
+
+
+class LocalPeerServer:
+    """
+    A local stand-in for a Lattica peer, served over TCP with asyncio.
+
+    Requests and responses are newline-delimited JSON objects tagged with a
+    request id. Each request is handled in its own task, so a connection
+    can carry many pipelined requests at once and responses may come back
+    out of order. An optional per-request latency models model compute
+    time without blocking other requests.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.requests_served = 0
+        self._server = None
+
+    async def start(self):
+        """
+        Starts listening. With port=0 an ephemeral port is picked and stored.
+        """
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _handle(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(jsonlib.loads(line), writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def _respond(self, request, writer, write_lock):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        payload = request.get("json") or {}
+        response = {"completion": _complete(payload.get("prompt", ""))}
+        self.requests_served += 1
+        async with write_lock:
+            writer.write(jsonlib.dumps({"id": request["id"], "response": response}).encode() + b"\n")
+            await writer.drain()
+
+
+class _PeerConnection:
+    """
+    One pipelined connection to a peer: many requests in flight, matched to
+    their responses by request id by a background reader task.
+    """
+    def __init__(self, reader, writer, max_in_flight):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self._ids = itertools.count()
+        self._reader_task = asyncio.ensure_future(self._read_responses())
+
+    async def request(self, endpoint, payload):
+        async with self.slots:
+            # The reader may have failed and cleared pending while we waited
+            if self.closed:
+                raise ConnectionError("Connection to Lattica peer closed.")
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
+            message = {"id": request_id, "endpoint": endpoint, "json": payload}
+            self.writer.write(jsonlib.dumps(message).encode() + b"\n")
+            await self.writer.drain()
+            return await future
+
+    async def _read_responses(self):
+        error = ConnectionError("Connection to Lattica peer closed.")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = jsonlib.loads(line)
+                future = self.pending.pop(message["id"], None)
+                if future is not None and not future.done():
+                    future.set_result(message["response"])
+        except Exception as exc:
+            error = exc
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    @property
+    def closed(self):
+        return self._reader_task.done()
+
+    async def close(self):
+        self.writer.close()
+        self._reader_task.cancel()
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+
+
+class AsyncClient:
+    """
+    An asyncio client for the Lattica network with a bounded peer pool.
+
+    Up to max_connections connections are opened lazily, spread round-robin
+    over the given peers, and each carries up to max_in_flight pipelined
+    requests. New requests go to the least-loaded open connection, so
+    throughput grows with the number of concurrent callers instead of
+    paying one round trip per request in series. Pass a ResponseCache to
+    answer repeated requests without a round trip.
+    """
+    def __init__(self, peers, max_connections=4, max_in_flight=32, cache=None):
+        if not peers:
+            raise ValueError("At least one (host, port) peer is required.")
+        self.peers = list(peers)
+        self.max_connections = max_connections
+        self.max_in_flight = max_in_flight
+        self.cache = cache
+        self._connections = []
+        self._peer_cycle = itertools.cycle(self.peers)
+        self._connect_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _acquire_connection(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            self._connections = [c for c in self._connections if not c.closed]
+            idle = [c for c in self._connections if not c.pending]
+            if idle:
+                return idle[0]
+            if len(self._connections) < self.max_connections:
+                host, port = next(self._peer_cycle)
+                reader, writer = await asyncio.open_connection(host, port)
+                connection = _PeerConnection(reader, writer, self.max_in_flight)
+                self._connections.append(connection)
+                return connection
+            return min(self._connections, key=lambda c: len(c.pending))
+
+    async def post(self, endpoint, json=None):
+        """
+        Sends one request to a service endpoint and awaits its response.
+        """
+        payload = json or {}
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, payload)
+            if cached is not None:
+                return cached
+        connection = await self._acquire_connection()
+        response = await connection.request(endpoint, payload)
+        if self.cache is not None and "error" not in response:
+            self.cache.put(endpoint, payload, response)
+        return response
+
+    async def post_many(self, requests, concurrency=64, return_exceptions=False):
+        """
+        Sends many (endpoint, json) requests concurrently, with backpressure.
+
+        At most `concurrency` requests are outstanding at any time; further
+        requests are pulled from the iterable only as earlier ones complete,
+        so a generator of requests is never materialized up front.
+
+        By default the first failing request cancels all outstanding ones
+        and its exception is raised once they have finished cancelling.
+        With return_exceptions=True, every request is attempted and a
+        failure is returned in place of that request's response.
+
+        Returns:
+            The responses (or exceptions), in the same order as the requests.
+        """
+        requests = iter(enumerate(requests))
+        results = {}
+
+        async def worker():
+            for index, (endpoint, payload) in requests:
+                try:
+                    results[index] = await self.post(endpoint, payload)
+                except Exception as exc:
+                    if not return_exceptions:
+                        raise
+                    results[index] = exc
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+        try:
+            done, _ = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            # Also reached if post_many itself is cancelled
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+        return [results[i] for i in range(len(results))]
+
+    async def close(self):
+        connections, self._connections = self._connections, []
+        for connection in connections:
+            await connection.close()
@@ -0,0 +1,224 @@
+"""
+Checksum verification stage for `parallax register`.
+
+Hashes a model weights file through a memory map in large chunks and checks
+it against the manifest's checksum. Two checksum forms are understood:
+
+    sha256:<hex>         plain SHA-256 of the file, streamed chunk by chunk
+    merkle-sha256:<hex>  SHA-256 Merkle root over fixed-size chunks, whose
+                         leaves are hashed in parallel threads, with
+                         RFC 6962 leaf/node prefixes and the file length
+
+Verified digests are cached in $PARALLAX_CACHE_DIR (default
+~/.cache/parallax) keyed by the file's path, size and mtime, so
+re-registering an unchanged model skips hashing entirely.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Leaf size of the Merkle tree; part of the merkle-sha256 definition
+MERKLE_CHUNK_BYTES = 64 * 1024 * 1024
+# Read size for the sequential sha256 stream
+STREAM_CHUNK_BYTES = 64 * 1024 * 1024
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "parallax")
+# Overrides DEFAULT_CACHE_DIR for every caller, in-process or CLI
+CACHE_DIR_ENV = "PARALLAX_CACHE_DIR"
+# Bumped whenever a checksum definition changes, invalidating cached digests
+CACHE_VERSION = 2
+
+
+def _open_map(path):
+    """
+    Returns (file, mmap) for a non-empty file, or (None, None) if it is empty.
+    """
+    f = open(path, "rb")
+    if os.fstat(f.fileno()).st_size == 0:
+        f.close()
+        return None, None
+    return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def sha256_file(path, chunk_bytes=STREAM_CHUNK_BYTES):
+    """
+    Streams the file through SHA-256 in memory-mapped chunks.
+    """
+    digest = hashlib.sha256()
+    f, mapped = _open_map(path)
+    if mapped is None:
+        return digest.hexdigest()
+    try:
+        with memoryview(mapped) as view:
+            for start in range(0, len(mapped), chunk_bytes):
+                digest.update(view[start:start + chunk_bytes])
+    finally:
+        mapped.close()
+        f.close()
+    return digest.hexdigest()
+
+
+def merkle_sha256_file(path, chunk_bytes=None, workers=None):
+    """
+    Computes the SHA-256 Merkle root of the file over fixed-size chunks.
+
+    Follows RFC 6962 domain separation: leaves are sha256(0x00 + chunk),
+    hashed concurrently by chunk range (hashlib releases the GIL on large
+    buffers), and levels are combined pairwise as sha256(0x01 + left +
+    right), with an odd node carried up as is. The result binds the file
+    length, sha256(0x02 + length as 8 big-endian bytes + root), so a file
+    made of inner-node digests cannot collide with the file they summarize.
+    """
+    chunk_bytes = chunk_bytes or MERKLE_CHUNK_BYTES
+    f, mapped = _open_map(path)
+    if mapped is None:
+        return _bind_length(0, hashlib.sha256().digest())
+    try:
+        length = len(mapped)
+        with memoryview(mapped) as view, ThreadPoolExecutor(max_workers=workers) as pool:
+            level = list(pool.map(
+                lambda start: _merkle_leaf(view[start:start + chunk_bytes]),
+                range(0, length, chunk_bytes),
+            ))
+    finally:
+        mapped.close()
+        f.close()
+
+    while len(level) > 1:
+        paired = [hashlib.sha256(b"\x01" + level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return _bind_length(length, level[0])
+
+
+def _merkle_leaf(chunk):
+    digest = hashlib.sha256(b"\x00")
+    digest.update(chunk)
+    return digest.digest()
+
+
+def _bind_length(length, root):
+    return hashlib.sha256(b"\x02" + length.to_bytes(8, "big") + root).hexdigest()
+
+
+ALGORITHMS = {
+    "sha256": sha256_file,
+    "merkle-sha256": merkle_sha256_file,
+}
+
+
+def default_cache_dir():
+    """
+    Returns the digest cache directory: $PARALLAX_CACHE_DIR, else DEFAULT_CACHE_DIR.
+    """
+    return os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+
+
+def _cache_path(cache_dir):
+    return os.path.join(cache_dir, "weights_checksums.json")
+
+
+def _load_cache(cache_dir):
+    try:
+        with open(_cache_path(cache_dir)) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache
+
+
+def _save_cache(cache_dir, cache):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = _cache_path(cache_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp_path, _cache_path(cache_dir))
+
+
+def file_checksum(path, algorithm="sha256", cache_dir=None):
+    """
+    Returns (hex digest, cached) for the file, reusing a cached digest when
+    the file's size and mtime are unchanged.
+
+    cache_dir defaults to default_cache_dir(), resolved at call time; pass
+    "" to disable the cache.
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm '{algorithm}'")
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = f"{algorithm}:{path}"
+    signature = [stat.st_size, stat.st_mtime_ns]
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    cache = _load_cache(cache_dir) if cache_dir else {}
+    entry = cache.get("entries", {}).get(key)
+    if entry is not None and entry["signature"] == signature:
+        return entry["digest"], True
+
+    digest = ALGORITHMS[algorithm](path)
+    if cache_dir:
+        cache.setdefault("entries", {})[key] = {"signature": signature, "digest": digest}
+        cache["version"] = CACHE_VERSION
+        _save_cache(cache_dir, cache)
+    return digest, False
+
+
+def verify(path, checksum, cache_dir=None):
+    """
+    Checks the file against an '<algorithm>:<hex>' checksum.
+
+    Returns:
+        (ok, actual checksum string, whether the digest came from cache).
+    """
+    algorithm, _, expected = checksum.partition(":")
+    digest, cached = file_checksum(path, algorithm, cache_dir)
+    return digest == expected.lower(), f"{algorithm}:{digest}", cached
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify model weights against a manifest checksum.")
+    parser.add_argument("--weights", required=True, help="Path to the model weights file.")
+    parser.add_argument("--checksum", help="Expected '<algorithm>:<hex>' checksum.")
+    parser.add_argument("--compute", choices=sorted(ALGORITHMS), help="Print the checksum instead of verifying.")
+    parser.add_argument("--cache-dir", help=f"Digest cache directory. Defaults to ${CACHE_DIR_ENV} or {DEFAULT_CACHE_DIR}.")
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.weights):
+        print(f"[PARALLAX] Error: Weights file not found at '{args.weights}'")
+        return 1
+
+    if args.compute:
+        digest, _ = file_checksum(args.weights, args.compute, args.cache_dir)
+        print(f"{args.compute}:{digest}")
+        return 0
+
+    if not args.checksum:
+        parser.error("--checksum is required unless --compute is given")
+
+    try:
+        ok, actual, cached = verify(args.weights, args.checksum, args.cache_dir)
+    except ValueError as e:
+        print(f"[PARALLAX] Error: {e}")
+        return 1
+
+    source = "cached" if cached else "hashed"
+    if not ok:
+        print(f"[PARALLAX] Error: Checksum mismatch for '{args.weights}' ({source})")
+        print(f"[PARALLAX]   expected {args.checksum}")
+        print(f"[PARALLAX]   actual   {actual}")
+        return 1
+    print(f"[PARALLAX] ==> Weights checksum verified ({source}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
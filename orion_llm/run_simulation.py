@@ -1,59 +1,286 @@
+import argparse
+import hashlib
+import json
 import subprocess
 import sys
 import os
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # Add the project directory to the Python path to allow importing 'lattica'
 project_root = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_root)
 
 from lattica_client import lattica
+from parallax import verify_weights
 
-def main():
+# Step fingerprints and outputs from previous runs
+STATE_PATH = os.path.join(project_root, ".pipeline_state.json")
+
+
+class Step:
+    """
+    One node of the simulation pipeline.
+
+    A step's fingerprint hashes its name, parameters, the contents of its
+    input files and the fingerprints of its dependencies. A cacheable step
+    whose fingerprint matches the previous run is skipped and its recorded
+    output reused.
+    """
+    def __init__(self, name, run, deps=(), inputs=(), params=None, cacheable=True):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.params = params or {}
+        self.cacheable = cacheable
+
+
+def _file_digest(path):
+    """
+    Content hash of an input file; large files reuse the cached weights digest.
+    """
+    digest, _ = verify_weights.file_checksum(path, "sha256")
+    return digest
+
+
+def _fingerprint(step, dep_fingerprints):
+    h = hashlib.sha256()
+    h.update(json.dumps([step.name, step.params], sort_keys=True).encode())
+    for path in step.inputs:
+        h.update(_file_digest(path).encode())
+    for dep in step.deps:
+        h.update(dep_fingerprints[dep].encode())
+    return h.hexdigest()
+
+
+def _load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path, state):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _topological_order(steps):
+    by_name = {step.name: step for step in steps}
+    order, visiting, done = [], set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting or name not in by_name:
+            raise ValueError(f"Cyclic or unknown dependency at step '{name}'")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(by_name[name])
+
+    for step in steps:
+        visit(step.name)
+    return order
+
+
+def run_pipeline(steps, state_path=STATE_PATH, force=False, max_workers=4):
+    """
+    Runs the steps as a DAG, overlapping steps whose dependencies are met.
+
+    Fingerprints are computed up front. A cacheable step whose fingerprint
+    matches the previous run is skipped and its recorded output reused; a
+    non-cacheable step (e.g. a background server) only runs if a step that
+    depends on it has to run, or if nothing depends on it. Each step's run
+    callable receives a dict of its dependencies' outputs and returns a
+    JSON-serializable output, and is submitted to a thread pool as soon as
+    all its dependencies have finished.
+
+    Returns:
+        A dict mapping step names to their outputs (None for steps that were
+        not needed).
+    """
+    order = _topological_order(steps)
+    state = {} if force else _load_state(state_path)
+    fingerprints, outputs = {}, {}
+
+    for step in order:
+        fingerprints[step.name] = _fingerprint(step, fingerprints)
+
+    def up_to_date(step):
+        previous = state.get(step.name)
+        return step.cacheable and previous is not None and previous["fingerprint"] == fingerprints[step.name]
+
+    # Walk dependents before dependencies to decide which steps must run
+    dependents = {step.name: [] for step in order}
+    for step in order:
+        for dep in step.deps:
+            dependents[dep].append(step.name)
+    needed = set()
+    for step in reversed(order):
+        if up_to_date(step):
+            continue
+        if step.cacheable or not dependents[step.name] or any(d in needed for d in dependents[step.name]):
+            needed.add(step.name)
+
+    remaining = {}
+    for step in order:
+        if step.name in needed:
+            remaining[step.name] = step
+        elif up_to_date(step):
+            print(f"[PIPELINE] {step.name}: up to date, skipped.")
+            outputs[step.name] = state[step.name]["output"]
+        else:
+            print(f"[PIPELINE] {step.name}: not needed, skipped.")
+            outputs[step.name] = None
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while remaining or running:
+            for name, step in list(remaining.items()):
+                if all(dep in outputs for dep in step.deps):
+                    del remaining[name]
+                    dep_outputs = {dep: outputs[dep] for dep in step.deps}
+                    running[pool.submit(step.run, dep_outputs)] = step
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                outputs[step.name] = future.result()
+                if step.cacheable:
+                    state[step.name] = {"fingerprint": fingerprints[step.name], "output": outputs[step.name]}
+                    _save_state(state_path, state)
+
+    return outputs
+
+
+class ManagedProcess:
+    """
+    A background process that is considered ready once a marker line
+    appears on its output, and is terminated when the pipeline ends.
+
+    A reader thread forwards the process output for its whole lifetime, so
+    the readiness wait honours its timeout even if the process stays
+    silent, and a server that keeps logging never blocks on a full pipe.
+    """
+    def __init__(self, args, ready_marker, timeout=30.0):
+        self.args = args
+        self.ready_marker = ready_marker
+        self.timeout = timeout
+        self.process = None
+        self._reader = None
+        self._settled = threading.Event()
+        self._ready = False
+
+    def _forward_output(self):
+        for line in self.process.stdout:
+            print(line, end="")
+            if not self._ready and self.ready_marker in line:
+                self._ready = True
+                self._settled.set()
+        # EOF: the process exited (or closed its output) before or after readiness
+        self._settled.set()
+
+    def start(self):
+        self._ready = False
+        self._settled.clear()
+        self.process = subprocess.Popen(
+            self.args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+            start_new_session=True,
+        )
+        self._reader = threading.Thread(target=self._forward_output, daemon=True)
+        self._reader.start()
+        self._settled.wait(self.timeout)
+        if self._ready:
+            return self
+        self.stop()
+        raise RuntimeError(f"'{self.args[0]}' exited or timed out before becoming ready")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            # Signal the whole process group, so children holding the
+            # output pipe (e.g. a server under a wrapper script) exit too
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+        if self._reader is not None:
+            self._reader.join(timeout=5.0)
+            self._reader = None
+
+
+def main(argv=None):
     """
     Orchestrates the full simulation of registering, serving, and querying the Orion LLM.
     """
+    parser = argparse.ArgumentParser(description="Run the Orion LLM deployment simulation.")
+    parser.add_argument("--force", action="store_true", help="Re-run every step, ignoring cached results.")
+    parser.add_argument("--prompt", default="Explain quantum tunneling in two sentences.")
+    args = parser.parse_args(argv)
+
     print("--- STARTING ORION LLM DEPLOYMENT SIMULATION ---")
     print("-" * 50)
 
-    # --- Step 1: Register the model with the mock Parallax tool ---
-    print("\n[SIMULATION] Step 1: Registering the model manifest...")
+    model_name = "orion-13b"
     manifest_path = os.path.join(project_root, "orion-13b.json")
+    weights_path = os.path.join(project_root, "orion-13b.ggml")
     register_script = os.path.join(project_root, "parallax", "register")
+    serve_script = os.path.join(project_root, "parallax", "serve")
+    endpoint = f"/{model_name}/v1/chat"
+    server = ManagedProcess([serve_script, "--model", model_name], ready_marker="is now being served")
 
-    try:
+    # --- Step 1: Verify the weights against the manifest checksum ---
+    def verify(_):
+        print("\n[SIMULATION] Step 1: Verifying the model weights...")
+        with open(manifest_path) as f:
+            checksum = json.load(f)["checksum"]
+        ok, actual, _ = verify_weights.verify(weights_path, checksum)
+        if not ok:
+            raise RuntimeError(f"weights checksum mismatch: expected {checksum}, got {actual}")
+        return {"checksum": actual}
+
+    # --- Step 2: Register the model with the mock Parallax tool ---
+    def register(_):
+        print("\n[SIMULATION] Step 2: Registering the model manifest...")
         subprocess.run([register_script, "--manifest", manifest_path], check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"[SIMULATION] Error during registration step: {e}")
-        sys.exit(1)
+        return {"model": model_name}
 
-    print("-" * 50)
+    # --- Step 3: Serve the model in the background, overlapping registration ---
+    def serve(_):
+        print("\n[SIMULATION] Step 3: Serving the model...")
+        server.start()
+        return {"endpoint": endpoint}
 
-    # --- Step 2: Serve the model with the mock Parallax tool ---
-    print("\n[SIMULATION] Step 2: Serving the model...")
-    serve_script = os.path.join(project_root, "parallax", "serve")
-    model_name = "orion-13b"
+    # --- Step 4: Use the Lattica client to query the served model ---
+    def query(deps):
+        print("\n[SIMULATION] Step 4: Querying the model via Lattica client...")
+        client = lattica.Client()
+        return client.post(deps["serve"]["endpoint"], json={"prompt": args.prompt})
+
+    steps = [
+        Step("verify", verify, inputs=[manifest_path, weights_path]),
+        Step("register", register, deps=["verify"]),
+        Step("serve", serve, deps=["verify"], cacheable=False),
+        Step("query", query, deps=["register", "serve"], params={"prompt": args.prompt}),
+    ]
 
     try:
-        # We run this in the background for a real scenario, but here we just run it
-        subprocess.run([serve_script, "--model", model_name], check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        print(f"[SIMULATION] Error during serving step: {e}")
+        outputs = run_pipeline(steps, force=args.force)
+    except (subprocess.CalledProcessError, FileNotFoundError, RuntimeError, ValueError) as e:
+        print(f"[SIMULATION] Error during pipeline: {e}")
         sys.exit(1)
+    finally:
+        server.stop()
 
-    print("-" * 50)
-
-    # --- Step 3: Use the Lattica client to query the served model ---
-    print("\n[SIMULATION] Step 3: Querying the model via Lattica client...")
-
-    # Initialize the client
-    client = lattica.Client()
-
-    # Send a request
-    response = client.post(
-        f"/{model_name}/v1/chat",
-        json={"prompt": "Explain quantum tunneling in two sentences."}
-    )
-
+    response = outputs["query"]
     print("\n[SIMULATION] Final response from Orion LLM:")
     print(f'>>> {response.get("completion", "No completion found.")}')
 
@@ -61,4 +288,4 @@ def main():
     print("--- SIMULATION COMPLETE ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,78 +1,264 @@
+import logging
 import numpy as np
-import json
-from typing import List, Dict, Any
+from typing import Any, Dict, List, Optional, Tuple, Union
+from src.results_io import save_result
+
+logger = logging.getLogger(__name__)
+
+# Output layouts supported by assign_plates
+OUTPUT_MODES = ("records", "columns", "structured")
+
+def latin_square(n: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Builds an n x n Latin square, randomized by the given generator.
+
+    The cyclic square (r + c) mod n is randomized with independent row,
+    column and symbol permutations, each of which preserves the Latin
+    property. Without an rng the plain cyclic square is returned.
+
+    Args:
+        n: The order of the square (number of arms).
+        rng: An optional np.random.Generator for the permutations.
+
+    Returns:
+        An (n, n) integer array in which every row and column holds each
+        symbol 0..n-1 exactly once.
+    """
+    rows = np.arange(n)
+    cols = np.arange(n)
+    symbols = np.arange(n)
+    if rng is not None:
+        rows = rng.permutation(n)
+        cols = rng.permutation(n)
+        symbols = rng.permutation(n)
+    return symbols[(rows[:, None] + cols[None, :]) % n]
+
+def plate_ids(num_plates: int) -> np.ndarray:
+    """
+    Returns the plate IDs 'plate_001', 'plate_002', ... as a string array.
+
+    IDs are assembled from digit bytes per digit-count group rather than
+    formatted one by one, which keeps a million IDs well under a second.
+    """
+    width = 6 + max(3, len(str(num_plates)))
+    ids = np.empty(num_plates, dtype=f"U{width}")
+    prefix = np.frombuffer(b"plate_", dtype=np.uint8)
+
+    low, digits = 1, 3
+    while low <= num_plates:
+        high = min(num_plates, 10**digits - 1)
+        numbers = np.arange(low, high + 1, dtype=np.int64)
+        powers = 10 ** np.arange(digits - 1, -1, -1, dtype=np.int64)
+        chars = np.empty((len(numbers), 6 + digits), dtype=np.uint8)
+        chars[:, :6] = prefix
+        chars[:, 6:] = numbers[:, None] // powers % 10 + ord("0")
+        ids[low - 1:high] = chars.view(f"S{6 + digits}").ravel()
+        low, digits = high + 1, digits + 1
+    return ids
 
 def assign_plates(
     num_plates: int = 12,
     arms: List[str] = None,
-    seed: int = 42
-) -> List[Dict[str, Any]]:
+    seed: int = 42,
+    output: str = "records",
+) -> Union[List[Dict[str, Any]], Dict[str, np.ndarray], np.ndarray]:
     """
     Assigns experimental arms to plates using a Latin-square-like design.
 
     This function creates a balanced assignment of treatments (arms) to
     experimental units (plates) to minimize confounding from spatial or
-    temporal effects. It tiles a base Latin square and then slices it to
-    fit the number of plates.
+    temporal effects. It tiles a seeded, randomized Latin square and then
+    slices it to fit the number of plates, so every run of len(arms)
+    consecutive plates receives each arm exactly once.
 
     Args:
         num_plates: The total number of plates to assign.
         arms: A list of treatment arm names. Defaults to ["A", "B", "C"].
         seed: A random seed for reproducibility.
+        output: "records" for a list of dicts, "columns" for a dict of
+            numpy arrays ("plate_id", "arm", "arm_index"), or "structured"
+            for a numpy structured array with "plate_id" and "arm" fields.
+            The columnar modes avoid per-plate Python objects.
 
     Returns:
-        A list of dictionaries, where each dictionary represents a plate
-        and its assigned arm and ID.
+        The plate assignments in the requested layout; in the default
+        layout, a list of dictionaries, where each dictionary represents a
+        plate and its assigned arm and ID.
     """
     if arms is None:
         arms = ["control", "treatment_1", "treatment_2"]
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output}', expected one of {OUTPUT_MODES}")
 
     rng = np.random.default_rng(seed)
 
-    # Create a base Latin square (e.g., 3x3 for 3 arms)
+    # Create a randomized base Latin square (e.g., 3x3 for 3 arms)
     n = len(arms)
-    base_square = np.array([ (np.arange(n) + i) % n for i in range(n) ])
+    square = latin_square(n, rng)
+
+    # Plate i takes column i mod n of row (i // n) mod n of the tiled square
+    plate_index = np.arange(num_plates)
+    arm_index = square[(plate_index // n) % n, plate_index % n]
+
+    # Sanity check: verify balance
+    counts = np.bincount(arm_index, minlength=n)
+    if logger.isEnabledFor(logging.INFO):
+        balance = dict(zip(arms, counts.tolist()))
+        logger.info("Arm balance check: %s", balance, extra={"arm_counts": balance})
 
-    # Tile the square to be large enough for all plates
-    repeats = int(np.ceil(num_plates / n))
-    tiled_square = np.tile(base_square, (repeats, 1))
+    if not np.all(counts == num_plates // n):
+        logger.warning(
+            "Arms are not perfectly balanced.",
+            extra={"num_plates": num_plates, "num_arms": n},
+        )
 
-    # Take a slice to match the number of plates
-    flat_indices = tiled_square.flatten()[:num_plates]
+    ids = plate_ids(num_plates)
+    arm_names = np.asarray(arms)[arm_index]
+
+    if output == "columns":
+        return {"plate_id": ids, "arm": arm_names, "arm_index": arm_index}
+    if output == "structured":
+        table = np.empty(num_plates, dtype=[("plate_id", ids.dtype), ("arm", arm_names.dtype)])
+        table["plate_id"] = ids
+        table["arm"] = arm_names
+        return table
 
     # Create the assignment list
-    assignments = []
-    for i in range(num_plates):
-        arm_index = flat_indices[i]
-        assignments.append({
-            "plate_id": f"plate_{i+1:03d}",
-            "arm": arms[arm_index]
-        })
+    return [
+        {"plate_id": plate_id, "arm": arms[i]}
+        for plate_id, i in zip(ids.tolist(), arm_index.tolist())
+    ]
 
-    # Sanity check: verify balance
-    assigned_arms = [a['arm'] for a in assignments]
-    counts = {arm: assigned_arms.count(arm) for arm in arms}
-    print("Arm balance check:", counts)
+def _orthogonal_coefficients(n: int, count: int) -> np.ndarray:
+    """
+    Picks multipliers a_1..a_count for the squares (a·r + c) mod n.
+
+    Each square is Latin if a is invertible mod n, and two squares are
+    orthogonal if their multipliers differ by an invertible amount, so the
+    multipliers are chosen greedily under those gcd conditions. For prime
+    n this yields up to n - 1 mutually orthogonal Latin squares.
+    """
+    chosen = []
+    for a in range(1, n):
+        if np.gcd(a, n) != 1:
+            continue
+        if all(np.gcd(a - b, n) == 1 for b in chosen):
+            chosen.append(a)
+        if len(chosen) == count:
+            return np.array(chosen)
+    raise ValueError(
+        f"Cannot build {count} mutually orthogonal Latin squares of order {n} by the "
+        "modular construction; use a prime number of arms or fewer blocking factors."
+    )
+
+def assign_blocked_design(
+    factors: List[str] = None,
+    arms: List[str] = None,
+    replicates: int = 1,
+    seed: int = 42,
+    output: str = "columns",
+) -> Tuple[Union[List[Dict[str, Any]], Dict[str, np.ndarray], np.ndarray], Dict[str, np.ndarray]]:
+    """
+    Assigns arms over several blocking factors with an orthogonal Latin design.
+
+    Each replicate is an n x n design (n = number of arms) whose rows and
+    columns are the levels of the first two factors. The arm and every
+    further factor are read from mutually orthogonal Latin squares, so with
+    three factors this is a Graeco-Latin square: each arm appears once per
+    level of every factor, and each (arm, level) pair of a further factor
+    occurs exactly once. Rows, columns and the symbols of every square are
+    randomized per replicate by seeded permutation tables, and all units
+    are generated by array indexing into those tables.
+
+    Args:
+        factors: Names of the blocking factors, each with len(arms) levels.
+            Defaults to ["batch", "day", "position"].
+        arms: A list of treatment arm names. Defaults to
+            ["control", "treatment_1", "treatment_2"].
+        replicates: The number of independently randomized n x n blocks.
+        seed: A random seed for reproducibility.
+        output: "records", "columns" or "structured", as in assign_plates.
+
+    Returns:
+        A tuple containing:
+        - The design in the requested layout, with a plate ID, replicate,
+          level of each factor and arm per unit.
+        - A dictionary mapping each factor name to its balance matrix of
+          shape (levels, arms), counting how often each arm occurs at each
+          level. A balanced design has every entry equal to replicates.
+    """
+    if factors is None:
+        factors = ["batch", "day", "position"]
+    if arms is None:
+        arms = ["control", "treatment_1", "treatment_2"]
+    if len(factors) < 2:
+        raise ValueError("A blocked design needs at least two blocking factors.")
+    if output not in OUTPUT_MODES:
+        raise ValueError(f"Unknown output mode '{output}', expected one of {OUTPUT_MODES}")
+
+    rng = np.random.default_rng(seed)
+    n = len(arms)
+    num_squares = len(factors) - 1  # the arm plus every factor beyond rows/columns
+    coefficients = _orthogonal_coefficients(n, num_squares)
+
+    # Precomputed permutation tables, one row per replicate
+    identity = np.tile(np.arange(n), (replicates, 1))
+    row_perm = rng.permuted(identity, axis=1)
+    col_perm = rng.permuted(identity, axis=1)
+    symbol_perm = rng.permuted(np.tile(identity, (num_squares, 1, 1)), axis=2)
+
+    num_units = replicates * n * n
+    unit = np.arange(num_units)
+    replicate = unit // (n * n)
+    row = (unit // n) % n
+    col = unit % n
+
+    # Square k at (r, c) is symbol_perm[k][(a_k·row_perm[r] + col_perm[c]) mod n]
+    cells = (coefficients[:, None] * row_perm[replicate, row] + col_perm[replicate, col]) % n
+    squares = symbol_perm[np.arange(num_squares)[:, None], replicate, cells]
+
+    arm_index = squares[0]
+    levels = {factors[0]: row, factors[1]: col}
+    for name, square in zip(factors[2:], squares[1:]):
+        levels[name] = square
+
+    balance = {
+        name: np.bincount(level * n + arm_index, minlength=n * n).reshape(n, n)
+        for name, level in levels.items()
+    }
+
+    ids = plate_ids(num_units)
+    arm_names = np.asarray(arms)[arm_index]
+    columns = {"plate_id": ids, "replicate": replicate, **levels, "arm": arm_names, "arm_index": arm_index}
 
-    if not all(c == num_plates // n for c in counts.values()):
-        print("Warning: Arms are not perfectly balanced.")
+    if output == "columns":
+        return columns, balance
+    if output == "structured":
+        table = np.empty(num_units, dtype=[(key, value.dtype) for key, value in columns.items()])
+        for key, value in columns.items():
+            table[key] = value
+        return table, balance
 
-    return assignments
+    keys = list(columns)
+    records = [dict(zip(keys, values)) for values in zip(*(columns[k].tolist() for k in keys))]
+    return records, balance
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     NUM_PLATES = 12
     TREATMENT_ARMS = ["Arm_X", "Arm_Y", "Arm_Z"]
 
     # Generate the plate assignments
-    plate_assignments = assign_plates(
+    table = assign_plates(
         num_plates=NUM_PLATES,
         arms=TREATMENT_ARMS,
-        seed=123
+        seed=123,
+        output="structured",
     )
 
-    # Save the assignment to a JSON file
+    # Save the assignment as a structured array
     output_dir = "results"
-    with open(f"{output_dir}/plate_assignment.json", "w") as f:
-        json.dump(plate_assignments, f, indent=4)
+    metadata = {"num_plates": NUM_PLATES, "arms": TREATMENT_ARMS, "seed": 123}
+    data_path = save_result(output_dir, "plate_assignment", table, metadata)
 
-    print(f"Plate assignments saved to '{output_dir}/plate_assignment.json'")
\ No newline at end of file
+    print(f"Plate assignments saved to '{data_path}'")
\ No newline at end of file
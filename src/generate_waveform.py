@@ -1,6 +1,87 @@
 import numpy as np
-import json
-from typing import Dict, Tuple, Any
+from typing import Any, Dict, Iterator, Optional, Tuple
+from src.instrumentation import session_from_env, stage
+from src.results_io import save_result
+
+def _phase_model(
+    duration: float,
+    sampling_rate: int,
+    frequency: float,
+    phi: float,
+) -> Tuple[int, float, float]:
+    """
+    Returns (num_samples, phase increment per sample, phase at sample 0).
+
+    Sample n of the raw signal is sin(2π·f·t_n + (n + 1)·phase_step), with
+    t_n = n·duration/num_samples, i.e. a pure sinusoid sin(ω·n + φ0).
+    """
+    num_samples = int(duration * sampling_rate)
+    phase_step = 2 * np.pi * phi / 13
+    sample_period = duration / num_samples if num_samples else 0.0
+    omega = 2 * np.pi * frequency * sample_period + phase_step
+    return num_samples, omega, phase_step
+
+def _sinusoid_rms(num_samples: int, omega: Any, phase0: Any) -> Any:
+    """
+    RMS of sin(ω·n + φ0) over n = 0..num_samples-1, in closed form.
+
+    Uses mean(sin²) = 1/2 - Σcos(2ω·n + 2φ0) / (2N) and the Dirichlet-kernel
+    sum Σcos(a·n + b) = sin(N·a/2) / sin(a/2) · cos(b + (N-1)·a/2).
+    Accepts scalars (returns a float) or arrays of ω and φ0.
+    """
+    a = 2 * np.asarray(omega, dtype=np.float64)
+    b = 2 * np.asarray(phase0, dtype=np.float64)
+    if num_samples <= 0:
+        rms = np.zeros(np.broadcast(a, b).shape)
+    else:
+        half_sin = np.sin(a / 2)
+        degenerate = np.abs(half_sin) < 1e-12
+        safe_half_sin = np.where(degenerate, 1.0, half_sin)
+        cos_sum = np.where(
+            degenerate,
+            num_samples * np.cos(b),
+            np.sin(num_samples * a / 2) / safe_half_sin * np.cos(b + (num_samples - 1) * a / 2),
+        )
+        rms = np.sqrt(np.maximum(0.5 - cos_sum / (2 * num_samples), 0.0))
+    return float(rms) if rms.ndim == 0 else rms
+
+# Shared read-only sample offsets 0..RENDER_BLOCK-1 for in-place rendering
+RENDER_BLOCK = 65536
+_BLOCK_INDEX = np.arange(RENDER_BLOCK, dtype=np.float64)
+_BLOCK_INDEX.setflags(write=False)
+
+def _render(
+    out: np.ndarray,
+    start: int,
+    omega: Any,
+    phase0: Any,
+    scale_factor: Any,
+) -> np.ndarray:
+    """
+    Writes scale_factor·sin(ω·n + φ0) for n = start, start+1, ... into out.
+
+    Samples run along the last axis of out; for a 2-D bank, omega, phase0
+    and scale_factor are (n_configs, 1) columns broadcast across it. Angles
+    are always evaluated in float64, block by block. A float64 out is used
+    as its own scratch space, so no temporaries are allocated; other dtypes
+    go through a single float64 block buffer of about RENDER_BLOCK values.
+    """
+    num_samples = out.shape[-1]
+    rows = int(np.prod(out.shape[:-1]))
+    width = max(256, RENDER_BLOCK // max(rows, 1))
+
+    scratch = None
+    if out.dtype != np.float64:
+        scratch = np.empty(out.shape[:-1] + (min(num_samples, width),), dtype=np.float64)
+
+    for offset in range(0, num_samples, width):
+        target = out[..., offset:offset + width]
+        angles = target if scratch is None else scratch[..., :target.shape[-1]]
+        np.multiply(_BLOCK_INDEX[:target.shape[-1]], omega, out=angles)
+        angles += (start + offset) * omega + phase0
+        np.sin(angles, out=angles)
+        np.multiply(angles, scale_factor, out=target, casting="same_kind")
+    return out
 
 def generate_waveform(
     duration: float = 1.0,
@@ -8,6 +89,8 @@ def generate_waveform(
     frequency: float = 440.0,
     phi: float = 1.61803398875,
     target_rms: float = 0.5,
+    out: Optional[np.ndarray] = None,
+    dtype: Any = np.float64,
 ) -> Tuple[np.ndarray, Dict[str, Any]]:
     """
     Generates a phase-modulated waveform with a specific RMS level.
@@ -22,28 +105,35 @@ def generate_waveform(
         frequency: The base frequency of the sine wave in Hz.
         phi: The multiplier for the phase step, creating non-periodic behavior.
         target_rms: The desired RMS amplitude of the output signal.
+        out: An optional preallocated 1D array of int(duration * sampling_rate)
+            samples to write the waveform into. With a float64 buffer the
+            call allocates no temporaries, which suits tight loops.
+        dtype: The dtype of the returned waveform when out is not given.
 
     Returns:
         A tuple containing:
-        - A numpy array of the generated waveform.
+        - A numpy array of the generated waveform (out, if given).
         - A dictionary with metadata, including the final calibration factor.
     """
-    num_samples = int(duration * sampling_rate)
-    time = np.linspace(0, duration, num_samples, endpoint=False)
-
-    # Generate phase steps; using a large prime ensures a long repeat period
-    phase_step = 2 * np.pi * phi / 13
-    phase = np.cumsum(np.ones(num_samples) * phase_step)
+    # Phase advances by a constant step per sample; using a large prime in
+    # the step ensures a long repeat period. Sample n is sin(ω·n + φ0).
+    with stage("generate_waveform.phase"):
+        num_samples, omega, phase0 = _phase_model(duration, sampling_rate, frequency, phi)
 
-    # Create the core signal
-    signal = np.sin(2 * np.pi * frequency * time + phase)
+    if out is None:
+        out = np.empty(num_samples, dtype=dtype)
+    elif out.shape != (num_samples,):
+        raise ValueError(f"out must have shape ({num_samples},), got {out.shape}")
 
-    # Calculate the initial RMS and the required scaling factor
-    initial_rms = np.sqrt(np.mean(signal**2))
-    scale_factor = target_rms / initial_rms if initial_rms > 0 else 0
+    # The RMS of a pure sinusoid has a closed form, so neither the initial
+    # nor the final RMS needs an extra pass over the samples
+    with stage("generate_waveform.calibrate", samples=num_samples):
+        initial_rms = _sinusoid_rms(num_samples, omega, phase0)
+        scale_factor = target_rms / initial_rms if initial_rms > 0 else 0
 
-    # Apply scaling
-    calibrated_signal = signal * scale_factor
+    # Create and scale the signal in place; sin and scale are fused per block
+    with stage("generate_waveform.render", samples=num_samples, nbytes=out.nbytes):
+        calibrated_signal = _render(out, 0, omega, phase0, scale_factor)
 
     # Store metadata
     metadata = {
@@ -54,11 +144,126 @@ def generate_waveform(
         "target_rms": target_rms,
         "initial_rms": initial_rms,
         "calibration_factor": scale_factor,
-        "final_rms": np.sqrt(np.mean(calibrated_signal**2)),
+        "final_rms": initial_rms * abs(scale_factor),
     }
 
     return calibrated_signal, metadata
 
+def generate_waveform_blocks(
+    duration: float = 1.0,
+    sampling_rate: int = 44100,
+    frequency: float = 440.0,
+    phi: float = 1.61803398875,
+    target_rms: float = 0.5,
+    block_size: int = 65536,
+    dtype: Any = np.float32,
+) -> Iterator[np.ndarray]:
+    """
+    Yields the calibrated waveform of generate_waveform in fixed-size blocks.
+
+    The RMS calibration factor is computed analytically up front, and each
+    block's phase is derived from its absolute sample index, so the phase
+    is continuous across blocks and peak memory is one block regardless of
+    the duration. Concatenating the blocks reproduces generate_waveform's
+    output to within the precision of dtype.
+
+    Args:
+        duration: The total duration of the waveform in seconds.
+        sampling_rate: The number of samples per second (Hz).
+        frequency: The base frequency of the sine wave in Hz.
+        phi: The multiplier for the phase step, creating non-periodic behavior.
+        target_rms: The desired RMS amplitude of the output signal.
+        block_size: The number of samples per yielded block. The last block
+            may be shorter.
+        dtype: The dtype of the yielded blocks.
+
+    Yields:
+        1D numpy arrays of up to block_size samples.
+    """
+    num_samples, omega, phase0 = _phase_model(duration, sampling_rate, frequency, phi)
+    initial_rms = _sinusoid_rms(num_samples, omega, phase0)
+    scale_factor = target_rms / initial_rms if initial_rms > 0 else 0
+
+    for start in range(0, num_samples, block_size):
+        block = np.empty(min(block_size, num_samples - start), dtype=dtype)
+        yield _render(block, start, omega, phase0, scale_factor)
+
+# Per-configuration metadata of a waveform bank, mirroring generate_waveform
+WAVEFORM_BANK_DTYPE = np.dtype([
+    ("duration_s", np.float64),
+    ("sampling_rate_hz", np.int64),
+    ("base_frequency_hz", np.float64),
+    ("phi", np.float64),
+    ("target_rms", np.float64),
+    ("initial_rms", np.float64),
+    ("calibration_factor", np.float64),
+    ("final_rms", np.float64),
+])
+
+def generate_waveform_bank(
+    frequencies: Any,
+    phis: Any = 1.61803398875,
+    target_rms: Any = 0.5,
+    duration: float = 1.0,
+    sampling_rate: int = 44100,
+    out: Optional[np.ndarray] = None,
+    dtype: Any = np.float64,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Generates a bank of calibrated waveforms in one vectorized pass.
+
+    frequencies, phis and target_rms are broadcast against each other, so
+    a sweep can pass arrays for all three or scalars for some. Row i of the
+    bank matches generate_waveform(duration, sampling_rate, frequencies[i],
+    phis[i], target_rms[i])[0] up to floating-point rounding.
+
+    Args:
+        frequencies: Base frequencies of the sine waves in Hz.
+        phis: Phase-step multipliers, one per configuration or a scalar.
+        target_rms: Desired RMS amplitudes, one per configuration or a scalar.
+        duration: The total duration of every waveform in seconds.
+        sampling_rate: The number of samples per second (Hz).
+        out: An optional preallocated (n_configs, n_samples) array.
+        dtype: The dtype of the returned bank when out is not given.
+
+    Returns:
+        A tuple containing:
+        - A (n_configs, n_samples) numpy array of waveforms.
+        - A structured numpy array of WAVEFORM_BANK_DTYPE metadata records.
+    """
+    frequencies, phis, target_rms = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(frequencies, dtype=np.float64)),
+        np.asarray(phis, dtype=np.float64),
+        np.asarray(target_rms, dtype=np.float64),
+    )
+    if frequencies.ndim != 1:
+        raise ValueError("frequencies, phis and target_rms must broadcast to a 1D shape")
+    num_configs = len(frequencies)
+
+    num_samples, omega, phase0 = _phase_model(duration, sampling_rate, frequencies, phis)
+    if out is None:
+        out = np.empty((num_configs, num_samples), dtype=dtype)
+    elif out.shape != (num_configs, num_samples):
+        raise ValueError(f"out must have shape ({num_configs}, {num_samples}), got {out.shape}")
+
+    initial_rms = _sinusoid_rms(num_samples, omega, phase0)
+    safe_rms = np.where(initial_rms > 0, initial_rms, 1.0)
+    scale_factor = np.where(initial_rms > 0, target_rms / safe_rms, 0.0)
+
+    _render(out, 0, omega[:, None], phase0[:, None], scale_factor[:, None])
+
+    metadata = np.empty(num_configs, dtype=WAVEFORM_BANK_DTYPE)
+    metadata["duration_s"] = duration
+    metadata["sampling_rate_hz"] = sampling_rate
+    metadata["base_frequency_hz"] = frequencies
+    metadata["phi"] = phis
+    metadata["target_rms"] = target_rms
+    metadata["initial_rms"] = initial_rms
+    metadata["calibration_factor"] = scale_factor
+    metadata["final_rms"] = initial_rms * np.abs(scale_factor)
+
+    return out, metadata
+
 if __name__ == "__main__":
     # Parameters
     WAVEFORM_DURATION = 5.0  # seconds
@@ -66,19 +271,18 @@ if __name__ == "__main__":
     TARGET_FREQUENCY = 1000.0  # Hz
     TARGET_RMS_T = 0.1  # Target amplitude for magnetometer
 
-    # Generate the waveform
-    waveform, meta = generate_waveform(
-        duration=WAVEFORM_DURATION,
-        sampling_rate=SAMPLING_RATE,
-        frequency=TARGET_FREQUENCY,
-        target_rms=TARGET_RMS_T,
-    )
+    # Generate the waveform; INSTRUMENT_TRACE/INSTRUMENT_PROFILE export timings
+    with session_from_env():
+        waveform, meta = generate_waveform(
+            duration=WAVEFORM_DURATION,
+            sampling_rate=SAMPLING_RATE,
+            frequency=TARGET_FREQUENCY,
+            target_rms=TARGET_RMS_T,
+        )
 
     # Save the results
     output_dir = "results"
-    np.savetxt(f"{output_dir}/waveform.csv", waveform, delimiter=",")
-    with open(f"{output_dir}/waveform_metadata.json", "w") as f:
-        json.dump(meta, f, indent=4)
+    data_path = save_result(output_dir, "waveform", waveform, meta)
 
-    print("Waveform generated and saved to 'results/waveform.csv'")
-    print("Metadata saved to 'results/waveform_metadata.json'")
\ No newline at end of file
+    print(f"Waveform generated and saved to '{data_path}'")
+    print(f"Metadata saved to '{output_dir}/waveform.json'")
\ No newline at end of file
@@ -0,0 +1,211 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Global switch; while False, stage() hands back a shared no-op context
+_enabled = False
+_records: List[Dict[str, Any]] = []
+# True while tracemalloc runs because enable() started it
+_started_tracemalloc = False
+_lock = threading.Lock()
+
+class _NullStage:
+    """No-op context returned by stage() while instrumentation is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    """Times one stage and records it on exit."""
+
+    __slots__ = ("name", "sizes", "_start_ns", "_blocks", "_traced")
+
+    def __init__(self, name: str, sizes: Dict[str, Any]):
+        self.name = name
+        self.sizes = sizes
+
+    def __enter__(self):
+        self._blocks = sys.getallocatedblocks()
+        self._traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        end_ns = time.perf_counter_ns()
+        record = {
+            "name": self.name,
+            "start_us": self._start_ns / 1e3,
+            "duration_s": (end_ns - self._start_ns) / 1e9,
+            "allocated_blocks": sys.getallocatedblocks() - self._blocks,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "sizes": self.sizes,
+        }
+        if self._traced is not None and tracemalloc.is_tracing():
+            record["traced_bytes"] = tracemalloc.get_traced_memory()[0] - self._traced
+        with _lock:
+            _records.append(record)
+        return False
+
+def enable(trace_memory: bool = False) -> None:
+    """
+    Turns stage recording on.
+
+    Args:
+        trace_memory: If True, also start tracemalloc so each stage records
+            the net bytes it left allocated (including NumPy buffers).
+    """
+    global _enabled, _started_tracemalloc
+    _enabled = True
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+def disable() -> None:
+    """
+    Turns stage recording off (recorded stages are kept).
+
+    tracemalloc is stopped only if enable() started it, so tracing begun
+    by the caller keeps running.
+    """
+    global _enabled, _started_tracemalloc
+    _enabled = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    """Discards all recorded stages."""
+    with _lock:
+        _records.clear()
+
+def records() -> List[Dict[str, Any]]:
+    """Returns a copy of the recorded stages, in completion order."""
+    with _lock:
+        return list(_records)
+
+def stage(name: str, **sizes: Any):
+    """
+    Context manager that records wall time, allocation count and sizes.
+
+    While instrumentation is disabled this returns a shared no-op context,
+    so a hot path pays only for the call itself.
+
+    Args:
+        name: The stage name, e.g. "estimate_g2.histogram".
+        **sizes: Array sizes or other scalars to attach to the record.
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name, sizes)
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """Aggregates the recorded stages into per-name call counts and times."""
+    totals: Dict[str, Dict[str, float]] = {}
+    for record in records():
+        entry = totals.setdefault(record["name"], {"calls": 0, "total_s": 0.0, "max_s": 0.0})
+        entry["calls"] += 1
+        entry["total_s"] += record["duration_s"]
+        entry["max_s"] = max(entry["max_s"], record["duration_s"])
+    return totals
+
+def export_chrome_trace(path: str) -> str:
+    """
+    Writes the recorded stages as Chrome trace-event JSON.
+
+    The file opens in chrome://tracing or Perfetto, with one complete ("X")
+    event per stage and its sizes and allocation counts as arguments.
+    """
+    events = []
+    for record in records():
+        args = dict(record["sizes"])
+        args["allocated_blocks"] = record["allocated_blocks"]
+        if "traced_bytes" in record:
+            args["traced_bytes"] = record["traced_bytes"]
+        events.append({
+            "name": record["name"],
+            "ph": "X",
+            "ts": record["start_us"],
+            "dur": record["duration_s"] * 1e6,
+            "pid": record["pid"],
+            "tid": record["tid"],
+            "args": args,
+        })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return path
+
+@contextmanager
+def profile(path: Optional[str] = None) -> Iterator[cProfile.Profile]:
+    """
+    Runs the enclosed block under cProfile.
+
+    Args:
+        path: If given, the stats are dumped there for pstats or snakeviz.
+
+    Yields:
+        The cProfile.Profile object.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+
+# Environment variables that turn on exports for the scripts' __main__ runs
+TRACE_ENV = "INSTRUMENT_TRACE"
+PROFILE_ENV = "INSTRUMENT_PROFILE"
+
+@contextmanager
+def session(
+    trace_path: Optional[str] = None,
+    profile_path: Optional[str] = None,
+    trace_memory: bool = False,
+) -> Iterator[None]:
+    """
+    Records the enclosed block and exports it on exit.
+
+    With neither path given this does nothing, so scripts can wrap their
+    work unconditionally. Otherwise stages are recorded (and the block run
+    under cProfile if profile_path is given), the Chrome trace is written
+    to trace_path, and the previous enabled state is restored.
+    """
+    if trace_path is None and profile_path is None:
+        yield
+        return
+
+    was_enabled = _enabled
+    reset()
+    enable(trace_memory=trace_memory)
+    try:
+        if profile_path is not None:
+            with profile(profile_path):
+                yield
+        else:
+            yield
+    finally:
+        if not was_enabled:
+            disable()
+        if trace_path is not None:
+            export_chrome_trace(trace_path)
+
+def session_from_env() -> Any:
+    """session() configured from the INSTRUMENT_TRACE and INSTRUMENT_PROFILE variables."""
+    return session(os.environ.get(TRACE_ENV), os.environ.get(PROFILE_ENV))
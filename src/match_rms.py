@@ -1,6 +1,65 @@
+import logging
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Tuple
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+def _new_qc_figure(time: np.ndarray, target_rms: float) -> Tuple[Any, Any, Any]:
+    """
+    Builds the QC figure on a headless Agg canvas.
+
+    matplotlib is imported here rather than at module load, and the
+    object-oriented Figure API is used instead of pyplot, so importing this
+    module stays cheap and no global pyplot state or GUI backend is touched.
+
+    Returns:
+        The (figure, axes, measured-RMS line) triple.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    line, = ax.plot(time, np.full(len(time), target_rms), label="Measured RMS (Simulated)", alpha=0.8)
+    ax.axhline(y=target_rms, color='r', linestyle='--', label=f"Target RMS = {target_rms}")
+    ax.set_title("Magnetometer RMS Matching QC Plot")
+    ax.set_xlabel("Time (arbitrary units)")
+    ax.set_ylabel("Measured B_rms")
+    ax.legend()
+    ax.grid(True)
+    return fig, ax, line
+
+def save_qc_plots(
+    time: np.ndarray,
+    traces: Sequence[np.ndarray],
+    target_rms: float,
+    plot_paths: Sequence[str],
+) -> List[str]:
+    """
+    Renders one QC plot per trace, reusing a single figure and line artist.
+
+    Only the line's y-data and the axis limits change between traces, so
+    the per-plot cost is essentially the PNG rendering itself.
+
+    Args:
+        time: The time steps shared by all traces.
+        traces: The measured RMS traces, e.g. rows of match_rms_batch output.
+        target_rms: The target RMS value drawn as a reference line.
+        plot_paths: The output image path for each trace.
+
+    Returns:
+        The list of written plot paths.
+    """
+    fig, ax, line = _new_qc_figure(time, target_rms)
+    written = []
+    for trace, plot_path in zip(traces, plot_paths):
+        line.set_ydata(trace)
+        ax.relim()
+        ax.autoscale_view()
+        fig.savefig(plot_path)
+        written.append(plot_path)
+    return written
 
 def match_rms(
     target_rms: float,
@@ -41,25 +100,216 @@ def match_rms(
     b_rms_noisy = b_rms + noise
 
     if plot_qc:
-        plt.figure(figsize=(10, 6))
-        plt.plot(time, b_rms_noisy, label="Measured RMS (Simulated)", alpha=0.8)
-        plt.axhline(y=target_rms, color='r', linestyle='--', label=f"Target RMS = {target_rms}")
-        plt.title("Magnetometer RMS Matching QC Plot")
-        plt.xlabel("Time (arbitrary units)")
-        plt.ylabel("Measured B_rms")
-        plt.legend()
-        plt.grid(True)
-
         # Save the plot
         output_dir = "results"
         plot_path = f"{output_dir}/magnetometer_rms_qc.png"
-        plt.savefig(plot_path)
-        print(f"QC plot saved to '{plot_path}'")
-        plt.close()
+        save_qc_plots(time, [b_rms_noisy], target_rms, [plot_path])
+        logger.info("QC plot saved to '%s'", plot_path, extra={"plot_path": plot_path})
 
     return time, b_rms_noisy
 
+def match_rms_batch(
+    target_rms: float,
+    noise_level: float = 0.01,
+    duration: int = 100,
+    n_trials: int = 1000,
+    seed: Optional[int] = None,
+    tolerance: Optional[float] = None,
+    steady_state_window: int = 20,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Simulates many noisy RMS-matching traces at once (Monte-Carlo mode).
+
+    Every trial follows the same convergence model as match_rms; the noise
+    for all trials comes from a single draw of a seeded np.random.Generator,
+    so the whole batch is one vectorized pass and reproducible.
+
+    Args:
+        target_rms: The target RMS value to achieve.
+        noise_level: The standard deviation of the measurement noise.
+        duration: The number of time steps per trial.
+        n_trials: The number of independent traces to simulate.
+        seed: A random seed for reproducibility.
+        tolerance: Half-width of the settling band around target_rms.
+            Defaults to 5% of target_rms.
+        steady_state_window: Number of final time steps averaged for the
+            steady-state error.
+
+    Returns:
+        A tuple containing:
+        - A numpy array of the time steps.
+        - A (n_trials, duration) numpy array of measured RMS values.
+        - A dictionary of per-trial statistics:
+          "settling_time" (first step after which the trace stays inside
+          the band; duration if it never settles), "settled" (bool), and
+          "steady_state_error" (mean deviation over the final window).
+          With duration 0 the traces are empty, no trial is settled and
+          the steady-state error is NaN.
+    """
+    rng = np.random.default_rng(seed)
+    if tolerance is None:
+        tolerance = 0.05 * abs(target_rms)
+
+    time = np.arange(duration)
+    initial_error = target_rms * 0.5
+    convergence_rate = 0.05
+    b_rms = target_rms - initial_error * np.exp(-convergence_rate * time)
+
+    traces = rng.normal(0, noise_level, size=(n_trials, duration))
+    traces += b_rms
+
+    if duration == 0:
+        # Empty traces never settle and have no steady state
+        stats = {
+            "settling_time": np.zeros(n_trials, dtype=np.intp),
+            "settled": np.zeros(n_trials, dtype=bool),
+            "steady_state_error": np.full(n_trials, np.nan),
+        }
+        return time, traces, stats
+
+    # Settling time: one past the last step outside the tolerance band
+    outside = np.abs(traces - target_rms) > tolerance
+    last_outside = duration - 1 - np.argmax(outside[:, ::-1], axis=1)
+    settling_time = np.where(outside.any(axis=1), last_outside + 1, 0)
+
+    window = min(steady_state_window, duration)
+    steady_state_error = traces[:, duration - window:].mean(axis=1) - target_rms
+
+    stats = {
+        "settling_time": settling_time,
+        "settled": settling_time < duration,
+        "steady_state_error": steady_state_error,
+    }
+    return time, traces, stats
+
+class WindowedRMS:
+    """
+    RMS estimator over the most recent `window` samples of a stream.
+
+    Squared samples are kept in a fixed-size ring buffer together with
+    their running sum, so each update costs O(block size) however large
+    the window is. The sum is recomputed from the buffer every
+    RESUM_WINDOWS windows of samples to stop rounding drift accumulating.
+
+    Args:
+        window: The number of most recent samples the estimate covers.
+    """
+
+    RESUM_WINDOWS = 64
+
+    def __init__(self, window: int = 4096):
+        self.window = window
+        self._squares = np.zeros(window, dtype=np.float64)
+        self._sum = 0.0
+        self._position = 0
+        self._filled = 0
+        self._since_resum = 0
+
+    def _replace(self, start: int, stop: int, squares: np.ndarray) -> None:
+        self._sum += squares.sum() - self._squares[start:stop].sum()
+        self._squares[start:stop] = squares
+
+    def update(self, samples: np.ndarray) -> float:
+        """Adds a block of samples and returns the current RMS estimate."""
+        squares = np.square(np.asarray(samples, dtype=np.float64))[-self.window:]
+        end = self._position + len(squares)
+        if end <= self.window:
+            self._replace(self._position, end, squares)
+        else:
+            split = self.window - self._position
+            self._replace(self._position, self.window, squares[:split])
+            self._replace(0, end - self.window, squares[split:])
+        self._position = end % self.window
+        self._filled = min(self._filled + len(squares), self.window)
+
+        self._since_resum += len(squares)
+        if self._since_resum >= self.RESUM_WINDOWS * self.window:
+            self._sum = float(self._squares.sum())
+            self._since_resum = 0
+        if self._filled == 0:
+            return 0.0
+        return float(np.sqrt(max(self._sum, 0.0) / self._filled))
+
+class ControlStep(NamedTuple):
+    """One step of closed_loop_rms: the block output and controller state."""
+    step: int
+    gain: float
+    measured_rms: float
+    error: float
+    saturated: bool
+    output: np.ndarray
+
+def closed_loop_rms(
+    blocks: Iterable[np.ndarray],
+    target_rms: float,
+    kp: float = 0.5,
+    ki: float = 0.2,
+    initial_gain: float = 1.0,
+    gain_limits: Tuple[Optional[float], Optional[float]] = (0.0, None),
+    window: int = 4096,
+    noise_level: float = 0.0,
+    seed: Optional[int] = None,
+) -> Iterator[ControlStep]:
+    """
+    Simulates a closed-loop PI controller matching the RMS of a sample stream.
+
+    Unlike match_rms, which replays an open-loop exponential, each step
+    here applies the current actuator gain to the next block of real
+    samples (e.g. from generate_waveform_blocks), estimates the RMS of the
+    output over a sliding window, and updates the gain with a PI law:
+
+        gain = initial_gain + kp * error + ki * Σ error
+
+    The gain is clamped to gain_limits; while it is saturated the integral
+    is not advanced (conditional-integration anti-windup). State is O(1) per
+    step plus the RMS window, so the generator can follow arbitrarily long
+    or live feeds.
+
+    Args:
+        blocks: An iterable or generator of 1D sample blocks.
+        target_rms: The RMS value the controlled output should reach.
+        kp: The proportional gain.
+        ki: The integral gain (per step).
+        initial_gain: The actuator gain before the first step.
+        gain_limits: (lower, upper) actuator limits; None means unbounded.
+        window: The number of output samples the RMS estimate covers.
+        noise_level: Standard deviation of noise added to each RMS
+            measurement.
+        seed: A random seed for the measurement noise.
+
+    Yields:
+        A ControlStep per input block. output is the block after the gain
+        in force during that step was applied.
+    """
+    rng = np.random.default_rng(seed)
+    lower, upper = gain_limits
+    estimator = WindowedRMS(window)
+    gain = initial_gain
+    integral = 0.0
+
+    for step, block in enumerate(blocks):
+        output = np.multiply(block, gain)
+        measured_rms = estimator.update(output)
+        if noise_level > 0:
+            measured_rms += rng.normal(0, noise_level)
+        error = target_rms - measured_rms
+
+        candidate_integral = integral + error
+        new_gain = initial_gain + kp * error + ki * candidate_integral
+        clamped = float(new_gain)
+        if lower is not None:
+            clamped = max(clamped, lower)
+        if upper is not None:
+            clamped = min(clamped, upper)
+        saturated = clamped != new_gain
+        if not saturated:
+            integral = candidate_integral
+
+        yield ControlStep(step, gain, measured_rms, error, saturated, output)
+        gain = clamped
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     TARGET_B_RMS = 0.1  # Example target RMS for the B field
     NOISE = 0.005       # Std dev of measurement noise
 
@@ -0,0 +1,156 @@
+import math
+import numpy as np
+from typing import Any, Iterator, Optional
+
+PHOTON_MODELS = ("poisson", "antibunched", "thermal")
+
+def _gaps(
+    rng: np.random.Generator,
+    model: str,
+    size: int,
+    rate: float,
+    lifetime: float,
+    coherence_time: float,
+) -> np.ndarray:
+    """Draws size independent inter-arrival gaps of the model's renewal process."""
+    if model == "antibunched":
+        # Excitation delay, then emission delay
+        return rng.exponential(1.0 / rate, size) + rng.exponential(lifetime, size)
+    if model == "thermal":
+        # Gap in on-time, plus the off periods of the on/off periods it spans:
+        # on periods end at rate 1/coherence_time in on-time, and each is
+        # followed by an Exp(coherence_time) off period
+        gaps = rng.exponential(1.0 / (2 * rate), size)
+        switches = rng.poisson(gaps / coherence_time)
+        spans = np.flatnonzero(switches)
+        gaps[spans] += rng.gamma(switches[spans], coherence_time)
+        return gaps
+    return rng.exponential(1.0 / rate, size)
+
+def iter_photon_chunks(
+    duration: float,
+    rate: float = 5e6,
+    model: str = "poisson",
+    chunk_size: int = 1_000_000,
+    dead_time: float = 0.0,
+    lifetime: float = 12e-9,
+    coherence_time: float = 10e-9,
+    efficiency: float = 1.0,
+    seed: Optional[int] = None,
+) -> Iterator[np.ndarray]:
+    """
+    Yields sorted photon arrival times over [0, duration) in chunks.
+
+    Every model is a renewal process: arrival times are cumulative sums of
+    independent random gaps, so a stream of N photons costs O(N) with no
+    sort, and memory is bounded by chunk_size. Chunks are in time order and
+    can be fed straight to G2Accumulator. A non-zero dead_time is a
+    non-paralyzable detector dead time added to every gap.
+
+    Models:
+        "poisson": coherent light; gaps are Exp(1/rate), g2(τ) = 1.
+        "antibunched": a single two-level emitter pumped at rate that decays
+            with the given lifetime. Each gap is the sum of an excitation and
+            an emission delay, so no two photons arrive together and
+            g2(0) = 0.
+        "thermal": bunched light of mean rate with the second-order
+            statistics of chaotic light, g2(τ) = 1 + exp(-2|τ|/coherence_time).
+            Photons are emitted at 2·rate during the "on" periods of a random
+            telegraph signal whose on and off periods are Exp(coherence_time).
+            This reproduces g2 exactly; higher orders differ from true
+            thermal light.
+
+    Args:
+        duration: The total duration of the stream in seconds.
+        rate: Photon rate (poisson, thermal) or pump rate (antibunched) in Hz.
+        model: One of PHOTON_MODELS.
+        chunk_size: The approximate number of photons per yielded chunk.
+        dead_time: Non-paralyzable detector dead time in seconds.
+        lifetime: Excited-state lifetime of the antibunched emitter.
+        coherence_time: Field coherence time of the thermal source.
+        efficiency: Detection probability; each photon is kept independently,
+            which scales the rate but leaves g2 unchanged.
+        seed: Seed for np.random.default_rng.
+
+    Yields:
+        1D float64 arrays of sorted arrival times in seconds.
+    """
+    if model not in PHOTON_MODELS:
+        raise ValueError(f"Unknown photon model '{model}', expected one of {PHOTON_MODELS}")
+    if rate <= 0 or duration <= 0:
+        return
+
+    rng = np.random.default_rng(seed)
+    last = 0.0
+    while last < duration:
+        gaps = _gaps(rng, model, chunk_size, rate, lifetime, coherence_time)
+        if dead_time > 0:
+            gaps += dead_time
+        times = np.cumsum(gaps, out=gaps)
+        times += last
+        last = times[-1]
+        if last >= duration:
+            times = times[:np.searchsorted(times, duration, side="left")]
+        if efficiency < 1.0:
+            times = times[rng.random(times.size) < efficiency]
+        if times.size:
+            yield times
+
+def photon_stream(duration: float, **kwargs: Any) -> np.ndarray:
+    """
+    Returns a whole synthetic photon stream as one sorted array.
+
+    Takes the same arguments as iter_photon_chunks and concatenates its
+    chunks; prefer the iterator for streams that do not fit in memory.
+    """
+    chunks = list(iter_photon_chunks(duration, **kwargs))
+    return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.float64)
+
+def ground_truth_g2(
+    tau: Any,
+    rate: float = 5e6,
+    model: str = "poisson",
+    dead_time: float = 0.0,
+    lifetime: float = 12e-9,
+    coherence_time: float = 10e-9,
+    bin_width: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Returns the exact g^(2)(τ) of a stream from iter_photon_chunks.
+
+    For τ >= 0 (g2 is symmetric, so |τ| is used):
+        poisson:      1, or with dead time d the renewal density over the
+                      mean rate, Σ_k r^k (τ-kd)^(k-1) e^(-r(τ-kd)) / (k-1)!
+                      for k ≥ 1 with kd < τ, divided by 1 / (d + 1/r)
+        antibunched:  1 - exp(-(r + 1/lifetime)·τ)
+        thermal:      1 + exp(-2τ / coherence_time)
+    The detection efficiency does not enter.
+
+    If bin_width is given, each value is averaged over [τ - bin_width/2,
+    τ + bin_width/2], which is what estimate_g2 measures at its bin centers.
+    """
+    if bin_width is not None:
+        offsets = (np.arange(32) + 0.5) / 32 - 0.5
+        points = np.asarray(tau, dtype=np.float64)[..., None] + offsets * bin_width
+        return ground_truth_g2(points, rate, model, dead_time, lifetime, coherence_time).mean(axis=-1)
+
+    tau = np.abs(np.asarray(tau, dtype=np.float64))
+    if model not in PHOTON_MODELS:
+        raise ValueError(f"Unknown photon model '{model}', expected one of {PHOTON_MODELS}")
+    if dead_time > 0 and model != "poisson":
+        raise ValueError(f"No closed-form g2 for the '{model}' model with dead time")
+    if model == "antibunched":
+        return 1.0 - np.exp(-(rate + 1.0 / lifetime) * tau)
+    if model == "thermal":
+        return 1.0 + np.exp(-2.0 * tau / coherence_time)
+    if dead_time <= 0:
+        return np.ones_like(tau)
+
+    # Sum of shifted Erlang densities, evaluated in log space
+    density = np.zeros_like(tau)
+    for k in range(1, int(tau.max(initial=0.0) / dead_time) + 1):
+        x = tau - k * dead_time
+        positive = x > 0
+        log_term = k * math.log(rate) + (k - 1) * np.log(np.where(positive, x, 1.0)) - rate * x - math.lgamma(k)
+        density += np.where(positive, np.exp(log_term), 0.0)
+    return density * (dead_time + 1.0 / rate)
@@ -0,0 +1,89 @@
+import numpy as np
+import json
+import os
+from typing import Any, Dict, Mapping, Optional, Tuple, Union
+
+ArrayData = Union[np.ndarray, Mapping[str, np.ndarray]]
+
+def _json_default(value: Any) -> Any:
+    """Converts numpy scalars and arrays in metadata to plain JSON types."""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def save_result(
+    output_dir: str,
+    name: str,
+    data: ArrayData,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Saves one result artifact as binary NumPy data plus a JSON sidecar.
+
+    A single array (including structured arrays) is written to
+    '<name>.npy', which can later be memory-mapped. A mapping of named
+    arrays is written to an uncompressed '<name>.npz'. Metadata, if any, is
+    written to '<name>.json'. The output directory is created if needed.
+
+    Args:
+        output_dir: The directory to write into.
+        name: The artifact name, without extension.
+        data: A numpy array or a mapping of names to numpy arrays.
+        metadata: An optional JSON-serializable dictionary.
+
+    Returns:
+        The path of the written data file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.join(output_dir, name)
+
+    if isinstance(data, Mapping):
+        data_path = f"{stem}.npz"
+        np.savez(data_path, **{key: np.asarray(value) for key, value in data.items()})
+    else:
+        data_path = f"{stem}.npy"
+        np.save(data_path, np.asarray(data), allow_pickle=False)
+
+    if metadata is not None:
+        with open(f"{stem}.json", "w") as f:
+            json.dump(metadata, f, indent=4, default=_json_default)
+
+    return data_path
+
+def load_result(
+    output_dir: str,
+    name: str,
+    mmap: bool = True,
+) -> Tuple[ArrayData, Optional[Dict[str, Any]]]:
+    """
+    Loads an artifact written by save_result.
+
+    Args:
+        output_dir: The directory the artifact was written to.
+        name: The artifact name, without extension.
+        mmap: If True, '.npy' data is memory-mapped read-only instead of
+            being read into memory. '.npz' archives are always read eagerly.
+
+    Returns:
+        A tuple containing:
+        - The array, or a dictionary of arrays for '.npz' artifacts.
+        - The metadata dictionary, or None if there is no sidecar.
+    """
+    stem = os.path.join(output_dir, name)
+
+    if os.path.exists(f"{stem}.npy"):
+        data = np.load(f"{stem}.npy", mmap_mode="r" if mmap else None, allow_pickle=False)
+    elif os.path.exists(f"{stem}.npz"):
+        with np.load(f"{stem}.npz", allow_pickle=False) as archive:
+            data = {key: archive[key] for key in archive.files}
+    else:
+        raise FileNotFoundError(f"No result artifact named '{name}' in '{output_dir}'")
+
+    metadata = None
+    if os.path.exists(f"{stem}.json"):
+        with open(f"{stem}.json") as f:
+            metadata = json.load(f)
+
+    return data, metadata
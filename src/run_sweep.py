@@ -0,0 +1,195 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.assign_plates import assign_plates
+from src.estimate_g2 import estimate_g2
+from src.generate_waveform import generate_waveform
+from src.photon_streams import photon_stream
+from src.results_io import save_result
+
+# Completed points, one JSON line each, appended as they finish
+MANIFEST_NAME = "sweep_manifest.jsonl"
+
+# Sweep used when no spec file is given; mirrors the scripts' __main__ runs
+DEFAULT_SPEC = {
+    "output_dir": "results/sweep",
+    "experiments": {
+        "waveform": {"duration": [5.0], "sampling_rate": [48000], "frequency": [440.0, 1000.0], "target_rms": [0.1]},
+        "g2": {"duration": [0.1], "rate": [5e6], "bin_width": [1e-9], "max_tau": [50e-9], "seed": [42]},
+        "plates": {"num_plates": [12], "arms": [["Arm_X", "Arm_Y", "Arm_Z"]], "seed": [123]},
+    },
+}
+
+def _run_waveform(params: Dict[str, Any]) -> Tuple[np.ndarray, Dict[str, Any]]:
+    return generate_waveform(**params)
+
+# g2 parameters that describe the synthetic photon source, not the estimator
+SOURCE_PARAMS = ("rate", "model", "dead_time", "lifetime", "coherence_time", "efficiency", "seed")
+
+def _run_g2(params: Dict[str, Any]) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+    params = dict(params)
+    duration = params.pop("duration", 0.1)
+    source = {key: params.pop(key) for key in SOURCE_PARAMS if key in params}
+    photons = photon_stream(duration, **source)
+    tau, g2 = estimate_g2(photons, duration=duration, **params)
+    if tau is None:
+        return None, {"num_photons": len(photons)}
+    result = np.empty(len(tau), dtype=[("tau_s", np.float64), ("g2", np.float64)])
+    result["tau_s"] = tau
+    result["g2"] = g2
+    return result, {"num_photons": len(photons)}
+
+def _run_plates(params: Dict[str, Any]) -> Tuple[np.ndarray, Dict[str, Any]]:
+    return assign_plates(output="structured", **params), {}
+
+# Experiment name -> callable(params) returning (data, metadata)
+EXPERIMENTS: Dict[str, Callable[[Dict[str, Any]], Tuple[Any, Dict[str, Any]]]] = {
+    "waveform": _run_waveform,
+    "g2": _run_g2,
+    "plates": _run_plates,
+}
+
+def point_name(experiment: str, params: Dict[str, Any]) -> str:
+    """Stable artifact name of a sweep point, derived from its parameters."""
+    key = json.dumps([experiment, params], sort_keys=True)
+    return f"{experiment}-{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+def expand_spec(spec: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Expands a sweep spec into (name, experiment, params) points.
+
+    spec["experiments"] maps an experiment name from EXPERIMENTS to a dict
+    of parameter -> list of values; every combination is one point. A
+    scalar is treated as a single-value list.
+    """
+    points = []
+    for experiment, grid in spec.get("experiments", {}).items():
+        if experiment not in EXPERIMENTS:
+            raise ValueError(f"Unknown experiment '{experiment}', expected one of {sorted(EXPERIMENTS)}")
+        keys = sorted(grid)
+        axes = [grid[k] if isinstance(grid[k], list) else [grid[k]] for k in keys]
+        for values in itertools.product(*axes):
+            params = dict(zip(keys, values))
+            points.append((point_name(experiment, params), experiment, params))
+    return points
+
+def read_manifest(output_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Returns the completed points recorded in output_dir, keyed by name."""
+    completed = {}
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                completed[entry["name"]] = entry
+    except FileNotFoundError:
+        pass
+    return completed
+
+def run_point(output_dir: str, name: str, experiment: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one point and saves it with save_result; returns its manifest entry."""
+    start = time.perf_counter()
+    data, metadata = EXPERIMENTS[experiment](params)
+    entry = {"name": name, "experiment": experiment, "params": params, "data_path": None}
+    if data is not None:
+        metadata = {**metadata, "sweep": {"experiment": experiment, "params": params}}
+        entry["data_path"] = save_result(output_dir, name, data, metadata)
+    entry["elapsed_s"] = time.perf_counter() - start
+    return entry
+
+def run_sweep(
+    spec: Dict[str, Any],
+    output_dir: Optional[str] = None,
+    workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Runs every point of a sweep spec, skipping points already completed.
+
+    Points run in a process pool whose workers are reused across points,
+    so numpy and the experiment modules are imported once per worker
+    rather than once per point. Each finished point is appended to the
+    manifest in output_dir as soon as it completes, so an interrupted
+    sweep resumes where it left off.
+
+    Args:
+        spec: The sweep spec (see expand_spec); may set "output_dir" and
+            "workers".
+        output_dir: Overrides spec["output_dir"]. Created if needed.
+        workers: Overrides spec["workers"]. 1 runs the points in-process.
+
+    Returns:
+        A dict with the "completed" and "skipped" point names and a
+        "failed" dict mapping point names to error messages.
+    """
+    output_dir = output_dir or spec.get("output_dir", "results/sweep")
+    workers = workers or spec.get("workers")
+    os.makedirs(output_dir, exist_ok=True)
+
+    done = read_manifest(output_dir)
+    points = expand_spec(spec)
+    pending = [p for p in points if p[0] not in done]
+    report = {"completed": [], "skipped": [p[0] for p in points if p[0] in done], "failed": {}}
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "a") as manifest:
+        def record(name, future_result):
+            try:
+                entry = future_result()
+            except Exception as e:
+                report["failed"][name] = f"{type(e).__name__}: {e}"
+                return
+            manifest.write(json.dumps(entry, sort_keys=True) + "\n")
+            manifest.flush()
+            report["completed"].append(name)
+
+        if workers == 1:
+            for name, experiment, params in pending:
+                record(name, lambda: run_point(output_dir, name, experiment, params))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {
+                    pool.submit(run_point, output_dir, name, experiment, params): name
+                    for name, experiment, params in pending
+                }
+                for future in as_completed(futures):
+                    record(futures[future], future.result)
+
+    return report
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a parameter sweep over the src/ experiments.")
+    parser.add_argument("spec", nargs="?", help="JSON sweep spec. Defaults to the built-in example sweep.")
+    parser.add_argument("--output-dir", help="Overrides the spec's output_dir.")
+    parser.add_argument("--workers", type=int, help="Process pool size (1 runs in-process).")
+    parser.add_argument("--dry-run", action="store_true", help="List the pending points without running them.")
+    args = parser.parse_args(argv)
+
+    spec = DEFAULT_SPEC
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+
+    if args.dry_run:
+        done = read_manifest(args.output_dir or spec.get("output_dir", "results/sweep"))
+        for name, experiment, params in expand_spec(spec):
+            status = "done" if name in done else "pending"
+            print(f"{name} [{status}] {experiment} {json.dumps(params, sort_keys=True)}")
+        return 0
+
+    report = run_sweep(spec, args.output_dir, args.workers)
+    print(f"Sweep finished: {len(report['completed'])} run, {len(report['skipped'])} already complete, "
+          f"{len(report['failed'])} failed.")
+    for name, error in report["failed"].items():
+        print(f"  {name}: {error}")
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import os
+import numpy as np
+from typing import Iterator, Optional, Sequence, Tuple, Union
+from src.estimate_g2 import G2Accumulator
+
+# Supported on-disk time-tag encodings: flat little-endian arrays of either
+# int64 picoseconds or float64 seconds, one tag per photon.
+TIME_TAG_UNITS = {
+    "ps": (np.dtype("<i8"), 1e-12),
+    "s": (np.dtype("<f8"), 1.0),
+}
+
+def _map_file(path: str, dtype: np.dtype) -> np.ndarray:
+    """Memory-maps a flat binary file read-only; np.memmap cannot map an empty file."""
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+def open_time_tags(path: str, unit: str = "ps") -> np.memmap:
+    """
+    Opens a flat binary time-tag file as a read-only memory map.
+
+    Nothing is read from disk until the returned array is indexed, so
+    arbitrarily large files can be opened instantly. An empty file gives
+    an empty array.
+
+    Args:
+        path: Path to the binary time-tag file.
+        unit: "ps" for int64 picosecond tags or "s" for float64 seconds.
+
+    Returns:
+        A 1D np.memmap (or empty array) over the raw tags, in the file's own unit.
+    """
+    if unit not in TIME_TAG_UNITS:
+        raise ValueError(f"Unknown time-tag unit '{unit}', expected one of {list(TIME_TAG_UNITS)}")
+    dtype, _ = TIME_TAG_UNITS[unit]
+    return _map_file(path, dtype)
+
+def iter_time_tag_chunks(
+    path: str,
+    unit: str = "ps",
+    chunk_size: int = 1 << 22,
+    channels: Optional[Union[str, np.ndarray]] = None,
+    channel: Optional[Union[int, Sequence[int]]] = None,
+    channel_dtype: str = "u1",
+) -> Iterator[np.ndarray]:
+    """
+    Yields arrival times in seconds from a time-tag file, chunk by chunk.
+
+    Float64-second files without a channel mask are yielded as views of
+    the memory map, so only the pages of the current chunk are read in;
+    G2Accumulator.update still copies each chunk into its working buffer.
+    Picosecond tags are converted per chunk relative to the first tag in
+    the file, which keeps sub-picosecond float64 precision for long runs.
+    An empty file yields nothing.
+
+    Args:
+        path: Path to the binary time-tag file.
+        unit: "ps" for int64 picosecond tags or "s" for float64 seconds.
+        chunk_size: Number of tags per yielded chunk.
+        channels: Optional per-tag channel numbers, either as an array or
+            as the path to a flat binary file parallel to the tag file.
+        channel: The channel number(s) to keep. Required with channels,
+            and only valid with them.
+        channel_dtype: The dtype of the channel file, if a path is given.
+
+    Yields:
+        1D float64 numpy arrays of arrival times in seconds.
+    """
+    tags = open_time_tags(path, unit)
+    _, scale = TIME_TAG_UNITS[unit]
+
+    mask_source = None
+    if channels is None and channel is not None:
+        raise ValueError("Channel data must be given to select a channel.")
+    if channels is not None:
+        if channel is None:
+            raise ValueError("A channel must be selected when channels are given.")
+        if isinstance(channels, str):
+            mask_source = _map_file(channels, np.dtype(channel_dtype))
+        else:
+            mask_source = np.asarray(channels)
+        if len(mask_source) != len(tags):
+            raise ValueError("Channel data must have one entry per time tag.")
+        wanted = np.atleast_1d(channel)
+
+    origin = tags[0] if unit == "ps" and len(tags) else 0
+    for start in range(0, len(tags), chunk_size):
+        chunk = tags[start:start + chunk_size]
+        if mask_source is not None:
+            chunk = chunk[np.isin(mask_source[start:start + chunk_size], wanted)]
+        if unit == "ps":
+            chunk = (chunk - origin) * scale
+        yield chunk
+
+def estimate_g2_from_file(
+    path: str,
+    unit: str = "ps",
+    bin_width: float = 1e-9,
+    max_tau: float = 1e-6,
+    duration: Optional[float] = None,
+    chunk_size: int = 1 << 22,
+    channels: Optional[Union[str, np.ndarray]] = None,
+    channel: Optional[Union[int, Sequence[int]]] = None,
+    channel_dtype: str = "u1",
+) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Estimates g^(2)(τ) directly from a time-tag file.
+
+    The file is streamed through a G2Accumulator, so peak memory depends on
+    chunk_size and max_tau rather than on the file size.
+
+    Args:
+        path: Path to the binary time-tag file.
+        unit: "ps" for int64 picosecond tags or "s" for float64 seconds.
+        bin_width: The width of the time bins for the histogram (in seconds).
+        max_tau: The maximum time delay (τ) to consider (in seconds).
+        duration: The measurement duration (in seconds). If None, the span
+            between the first and last selected photon is used.
+        chunk_size: Number of tags read per chunk.
+        channels: Optional per-tag channel numbers (array or file path).
+        channel: The channel number(s) to keep.
+        channel_dtype: The dtype of the channel file, if a path is given.
+
+    Returns:
+        The same (τ values, g^(2)(τ) values) tuple as estimate_g2.
+    """
+    accumulator = G2Accumulator(bin_width=bin_width, max_tau=max_tau, duration=duration)
+    accumulator.update_from(
+        iter_time_tag_chunks(
+            path, unit, chunk_size=chunk_size, channels=channels, channel=channel, channel_dtype=channel_dtype
+        )
+    )
+    return accumulator.result()
@@ -1,9 +1,9 @@
 import requests
 import json
 import subprocess
-import time
 import sys
 import os
+from load_test import wait_until_ready
 
 def main():
     """
@@ -23,10 +23,16 @@ def main():
     # Start the server as a background process
     server_process = subprocess.Popen([server_executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    # Give the server a moment to start
-    time.sleep(3)
+    # Wait until the server accepts connections instead of sleeping blindly
+    try:
+        waited = wait_until_ready("127.0.0.1", 8080, timeout=30.0, process=server_process)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        server_process.terminate()
+        server_process.wait()
+        sys.exit(1)
 
-    print("--- Server started. Sending RPC request... ---")
+    print(f"--- Server started after {waited:.2f}s. Sending RPC request... ---")
 
     rpc_url = "http://127.0.0.1:8080/rpc"
     payload = {
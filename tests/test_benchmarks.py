@@ -0,0 +1,133 @@
+import pytest
+import numpy as np
+import gc
+import math
+import os
+import json
+import time
+import tracemalloc
+from src.generate_waveform import generate_waveform
+from src.assign_plates import assign_plates
+from src.estimate_g2 import estimate_g2
+from src.match_rms import match_rms_batch
+from src.photon_streams import photon_stream
+
+# Benchmarks are opt-in: BENCHMARK=1 runs them against the stored baseline,
+# BENCHMARK_UPDATE=1 re-measures and rewrites the baseline instead. Wall
+# times and memory peaks are specific to the machine (and numpy build) that
+# recorded them, so re-record the baseline on each host you gate on; the
+# scaling exponent is the portable check.
+RUN_BENCHMARKS = os.environ.get("BENCHMARK") == "1" or os.environ.get("BENCHMARK_UPDATE") == "1"
+UPDATE_BASELINE = os.environ.get("BENCHMARK_UPDATE") == "1"
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+# Allowed regressions relative to the baseline
+EXPONENT_TOLERANCE = 0.3  # absolute increase of the log-log scaling exponent
+TIME_TOLERANCE = 3.0      # ratio of the largest-size wall time; a coarse backstop
+MEMORY_TOLERANCE = 1.5    # ratio of the largest-size tracemalloc peak
+REPEATS = 5
+MIN_TIMING_S = 0.2        # each repeat loops a workload for at least this long
+
+pytestmark = pytest.mark.skipif(not RUN_BENCHMARKS, reason="set BENCHMARK=1 to run benchmarks")
+
+# --- Workloads: each maps an input size N to a zero-argument callable ---
+
+def _g2_workload(n):
+    duration = n / 5e6  # constant photon rate, so the window occupancy is fixed
+    photons = photon_stream(duration, rate=5e6, seed=0)
+    return lambda: estimate_g2(photons, bin_width=1e-9, max_tau=50e-9, duration=duration)
+
+def _waveform_workload(n):
+    return lambda: generate_waveform(duration=n / 48000, sampling_rate=48000, frequency=1000.0)
+
+def _plates_workload(n):
+    return lambda: assign_plates(num_plates=n, arms=[f"arm_{i}" for i in range(24)], output="columns")
+
+def _match_rms_workload(n):
+    return lambda: match_rms_batch(target_rms=0.1, n_trials=n, seed=0)
+
+BENCHMARKS = {
+    "estimate_g2": (_g2_workload, [100_000, 300_000, 1_000_000]),
+    "generate_waveform": (_waveform_workload, [100_000, 1_000_000, 4_000_000]),
+    "assign_plates": (_plates_workload, [10_000, 100_000, 1_000_000]),
+    "match_rms_batch": (_match_rms_workload, [1_000, 10_000, 100_000]),
+}
+
+def time_per_call(run):
+    """
+    Best-of-REPEATS mean time of one call, with the garbage collector off.
+
+    Each repeat loops run() for at least MIN_TIMING_S, so millisecond
+    workloads are not at the mercy of a single scheduler hiccup.
+    """
+    start = time.perf_counter()
+    run()
+    loops = max(1, math.ceil(MIN_TIMING_S / max(time.perf_counter() - start, 1e-9)))
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        best = float("inf")
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            for _ in range(loops):
+                run()
+            best = min(best, (time.perf_counter() - start) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+def measure(workload, sizes):
+    """Per-call wall time (see time_per_call) and tracemalloc peak for each input size."""
+    times, peaks = {}, {}
+    for n in sizes:
+        run = workload(n)
+        times[str(n)] = time_per_call(run)
+
+        tracemalloc.start()
+        run()
+        peaks[str(n)] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    exponent = float(np.polyfit(np.log(sizes), np.log([times[str(n)] for n in sizes]), 1)[0])
+    return {"sizes": sizes, "time_s": times, "peak_bytes": peaks, "exponent": exponent}
+
+@pytest.fixture(scope="module")
+def baseline():
+    """Load the stored baseline, and write back any updates at the end."""
+    data = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            data = json.load(f)
+    yield data
+    if UPDATE_BASELINE:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(data, f, indent=4, sort_keys=True)
+
+@pytest.mark.parametrize("name", sorted(BENCHMARKS))
+def test_benchmark_scaling(name, baseline):
+    """Test scaling exponent, wall time and peak memory against the baseline."""
+    workload, sizes = BENCHMARKS[name]
+    result = measure(workload, sizes)
+
+    if UPDATE_BASELINE:
+        baseline[name] = result
+        return
+
+    if name not in baseline:
+        pytest.fail(f"No baseline for '{name}'; run with BENCHMARK_UPDATE=1 first")
+    expected = baseline[name]
+    largest = str(sizes[-1])
+
+    assert result["exponent"] <= expected["exponent"] + EXPONENT_TOLERANCE, (
+        f"{name} scales as N^{result['exponent']:.2f}, baseline N^{expected['exponent']:.2f}"
+    )
+    assert result["time_s"][largest] <= expected["time_s"][largest] * TIME_TOLERANCE, (
+        f"{name} took {result['time_s'][largest]:.4f}s at N={largest}, "
+        f"baseline {expected['time_s'][largest]:.4f}s"
+    )
+    assert result["peak_bytes"][largest] <= expected["peak_bytes"][largest] * MEMORY_TOLERANCE, (
+        f"{name} peaked at {result['peak_bytes'][largest]} bytes at N={largest}, "
+        f"baseline {expected['peak_bytes'][largest]}"
+    )
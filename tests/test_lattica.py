@@ -0,0 +1,201 @@
+import pytest
+import asyncio
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "orion_llm"))
+
+from lattica_client import lattica
+from lattica_client.lattica import AsyncClient, LocalPeerServer, ResponseCache
+
+ENDPOINT = "/orion-13b/v1/chat"
+
+def response(name):
+    """A response that serializes to 30 bytes, so max_bytes=80 holds two."""
+    return {"completion": name.ljust(13, ".")}
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable replacement for time.time() inside lattica."""
+    now = [1000.0]
+
+    def advance(seconds=1.0):
+        now[0] += seconds
+
+    monkeypatch.setattr(lattica.time, "time", lambda: now[0])
+    return advance
+
+# --- Tests for ResponseCache ---
+
+def test_cache_hits_misses_and_fresh_copies(clock):
+    """Test the hit/miss counters and that hits return independent copies."""
+    cache = ResponseCache()
+    assert cache.get(ENDPOINT, {"prompt": "a"}) is None
+    cache.put(ENDPOINT, {"prompt": "a"}, response("a"))
+
+    hit = cache.get("orion-13b//v1/chat/", {"prompt": "a"})
+    assert hit == response("a")
+    hit["completion"] = "mutated"
+    assert cache.get(ENDPOINT, {"prompt": "a"}) == response("a")
+    assert cache.get(ENDPOINT, {"prompt": "b"}) is None
+    assert cache.stats() == {"hits": 2, "misses": 2, "entries": 1, "bytes": 30}
+
+def test_cache_lru_order_and_byte_bound(clock):
+    """Test that the least recently used entry is evicted to stay under max_bytes."""
+    cache = ResponseCache(max_bytes=80)
+    cache.put(ENDPOINT, {"prompt": "a1"}, response("a1"))
+    clock()
+    cache.put(ENDPOINT, {"prompt": "a2"}, response("a2"))
+    clock()
+    assert cache.get(ENDPOINT, {"prompt": "a1"}) is not None
+    clock()
+    cache.put(ENDPOINT, {"prompt": "a3"}, response("a3"))
+
+    assert cache.stats()["bytes"] <= 80
+    assert cache.get(ENDPOINT, {"prompt": "a2"}) is None
+    assert cache.get(ENDPOINT, {"prompt": "a1"}) is not None
+    assert cache.get(ENDPOINT, {"prompt": "a3"}) is not None
+
+    cache.put(ENDPOINT, {"prompt": "huge"}, {"completion": "x" * 100})
+    assert cache.get(ENDPOINT, {"prompt": "huge"}) is None
+
+def test_cache_ttl_expiry(clock, tmp_path):
+    """Test that entries older than ttl miss in memory and on disk."""
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(ttl=10, path=path)
+    cache.put(ENDPOINT, {"prompt": "a"}, response("a"))
+    clock(5)
+    assert cache.get(ENDPOINT, {"prompt": "a"}) is not None
+    clock(6)
+    assert cache.get(ENDPOINT, {"prompt": "a"}) is None
+    cache.close()
+
+    cache = ResponseCache(ttl=10, path=path)
+    assert cache.get(ENDPOINT, {"prompt": "a"}) is None
+    cache.close()
+
+def test_cache_disk_lru_follows_memory_hits_across_restart(clock, tmp_path):
+    """Test that memory hits count toward disk LRU order, so hot entries survive a restart."""
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(max_bytes=80, path=path)
+    cache.put(ENDPOINT, {"prompt": "a1"}, response("a1"))
+    clock()
+    cache.put(ENDPOINT, {"prompt": "a2"}, response("a2"))
+    for _ in range(5):
+        clock()
+        assert cache.get(ENDPOINT, {"prompt": "a1"}) is not None
+    clock()
+    cache.put(ENDPOINT, {"prompt": "a3"}, response("a3"))
+    assert cache.get(ENDPOINT, {"prompt": "a2"}) is None
+    cache.close()
+
+    restarted = ResponseCache(max_bytes=80, path=path)
+    assert restarted.get(ENDPOINT, {"prompt": "a1"}) == response("a1")
+    assert restarted.get(ENDPOINT, {"prompt": "a3"}) == response("a3")
+    assert restarted.get(ENDPOINT, {"prompt": "a2"}) is None
+    assert restarted.stats()["hits"] == 2
+    restarted.close()
+
+# --- Tests for AsyncClient and LocalPeerServer ---
+
+class EchoPeer(LocalPeerServer):
+    """A peer that echoes prompts after a random delay and records its load."""
+
+    def __init__(self, fail_on=None, drop_on=None):
+        super().__init__(latency=0.0)
+        self.fail_on = fail_on
+        self.drop_on = drop_on
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await super()._handle(reader, writer)
+
+    async def _respond(self, request, writer, write_lock):
+        prompt = request["json"]["prompt"]
+        if prompt == self.drop_on:
+            writer.close()
+            return
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(random.uniform(0, 0.01))
+        self.in_flight -= 1
+        body = {"error": "refused"} if prompt == self.fail_on else {"completion": prompt}
+        async with write_lock:
+            writer.write(json.dumps({"id": request["id"], "response": body}).encode() + b"\n")
+            await writer.drain()
+
+def test_async_client_pipelined_responses_keep_request_order():
+    """Test that out-of-order pipelined responses are matched to their requests."""
+    async def scenario():
+        async with EchoPeer() as peer, AsyncClient([(peer.host, peer.port)], max_connections=1) as client:
+            requests = ((ENDPOINT, {"prompt": f"p{i}"}) for i in range(200))
+            responses = await client.post_many(requests, concurrency=50)
+            return responses, peer.connections, peer.max_in_flight
+
+    responses, connections, max_in_flight = asyncio.run(scenario())
+    assert [r["completion"] for r in responses] == [f"p{i}" for i in range(200)]
+    assert connections == 1
+    assert max_in_flight > 1
+
+def test_async_client_bounds_connections_and_in_flight():
+    """Test that max_connections and max_in_flight bound the load on peers."""
+    async def scenario():
+        async with EchoPeer() as a, EchoPeer() as b:
+            peers = [(a.host, a.port), (b.host, b.port)]
+            async with AsyncClient(peers, max_connections=3, max_in_flight=4) as client:
+                requests = [(ENDPOINT, {"prompt": f"p{i}"}) for i in range(300)]
+                await client.post_many(requests, concurrency=64)
+                return a.connections + b.connections, a.max_in_flight + b.max_in_flight, len(client._connections)
+
+    connections, max_in_flight, pooled = asyncio.run(scenario())
+    assert connections <= 3 and pooled <= 3
+    assert max_in_flight <= 3 * 4
+
+def test_async_client_peer_disconnect_fails_pending_requests():
+    """Test that a dropped connection fails its requests and is replaced."""
+    async def scenario():
+        async with EchoPeer(drop_on="drop") as peer, AsyncClient([(peer.host, peer.port)], max_connections=1) as client:
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(client.post(ENDPOINT, {"prompt": "drop"}), timeout=5)
+            response = await asyncio.wait_for(client.post(ENDPOINT, {"prompt": "after"}), timeout=5)
+            return response, peer.connections
+
+    response, connections = asyncio.run(scenario())
+    assert response == {"completion": "after"}
+    assert connections == 2
+
+def test_async_client_disconnect_fails_requests_waiting_for_a_slot():
+    """Test that a request queued behind the in-flight limit fails when the peer drops."""
+    async def scenario():
+        async with EchoPeer(drop_on="drop") as peer:
+            async with AsyncClient([(peer.host, peer.port)], max_connections=1, max_in_flight=1) as client:
+                first = asyncio.ensure_future(client.post(ENDPOINT, {"prompt": "drop"}))
+                second = asyncio.ensure_future(client.post(ENDPOINT, {"prompt": "queued"}))
+                return await asyncio.wait_for(asyncio.gather(first, second, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+def test_post_many_cancels_outstanding_requests_on_error():
+    """Test that the first failure cancels the other workers, or is returned in place."""
+    async def scenario(return_exceptions):
+        async with EchoPeer(drop_on="p3") as peer, AsyncClient([(peer.host, peer.port)], max_connections=2) as client:
+            requests = [(ENDPOINT, {"prompt": f"p{i}"}) for i in range(40)]
+            try:
+                return await client.post_many(requests, concurrency=8, return_exceptions=return_exceptions)
+            finally:
+                others = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+                assert not [t for t in others if "worker" in repr(t.get_coro())]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(scenario(False))
+
+    responses = asyncio.run(scenario(True))
+    assert len(responses) == 40
+    assert isinstance(responses[3], ConnectionError)
+    assert any(r == {"completion": "p39"} for r in responses)
@@ -0,0 +1,106 @@
+import pytest
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import load_test
+
+# --- A stand-in for the lattica-tool-server execute_code RPC ---
+
+class ExecuteCodeHandler(BaseHTTPRequestHandler):
+    """Answers execute_code with fuel_used equal to the code length."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        code = request["params"]["code"]
+        result = {"exit_code": 0, "stdout": "", "fuel_used": len(code), "timed_out": False}
+        body = json.dumps({"jsonrpc": "2.0", "result": result, "id": request["id"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ExecuteCodeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/rpc"
+    server.shutdown()
+    server.server_close()
+
+# --- Tests for load_test.py ---
+
+@pytest.mark.parametrize("pct, expected", [(0, 1), (1, 1), (50, 50), (95, 95), (99, 99), (99.5, 100), (100, 100)])
+def test_percentile_is_nearest_rank(pct, expected):
+    """Test nearest-rank percentiles on 1..100."""
+    assert load_test.percentile(list(range(1, 101)), pct) == expected
+
+def test_summarize_small_and_empty_inputs():
+    """Test summary statistics, including percentiles of a short list."""
+    assert load_test.summarize([]) == {"count": 0}
+    assert load_test.percentile([], 50) is None
+    stats = load_test.summarize([4.0, 1.0, 3.0, 2.0])
+    assert stats == {"count": 4, "min": 1.0, "mean": 2.5, "p50": 2.0, "p95": 4.0, "p99": 4.0, "max": 4.0}
+
+def test_wait_until_ready(stand_in_server):
+    """Test that readiness polling returns for a live port and times out otherwise."""
+    port = int(stand_in_server.split(":")[2].split("/")[0])
+    assert load_test.wait_until_ready("127.0.0.1", port, timeout=5) < 5
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    process.wait()
+    with pytest.raises(RuntimeError, match="code 3"):
+        load_test.wait_until_ready("127.0.0.1", closed_port, timeout=5, process=process)
+    with pytest.raises(RuntimeError, match="not ready"):
+        load_test.wait_until_ready("127.0.0.1", closed_port, timeout=0.1)
+
+def test_run_load_aggregates_fuel_per_payload(stand_in_server):
+    """Test the report fields against the stand-in server."""
+    args = SimpleNamespace(
+        url=stand_in_server, concurrency=4, requests=30, max_fuel=1000,
+        max_memory=1 << 20, timeout_ms=100, request_timeout=5.0,
+    )
+    payloads = {"short": "fn main() {}", "long": "fn main() { println!(\"hi\"); }"}
+    report = load_test.run_load(args, payloads)
+
+    assert (report["requests"], report["succeeded"], report["failed"]) == (30, 30, 0)
+    assert report["latency_ms"]["count"] == 30
+    assert report["requests_per_s"] > 0
+    for name, code in payloads.items():
+        stats = report["payloads"][name]
+        assert stats["latency_ms"]["count"] == 15
+        assert stats["fuel_used"]["count"] == 15
+        assert stats["fuel_used"]["min"] == stats["fuel_used"]["max"] == len(code)
+
+@pytest.mark.parametrize("max_p99_ms, expected_code", [(60000, 0), (0, 1)])
+def test_max_p99_gate_sets_exit_code(stand_in_server, tmp_path, max_p99_ms, expected_code):
+    """Test that --max-p99-ms fails the run when p99 latency exceeds it."""
+    output = tmp_path / "report.json"
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, "load_test.py"), "--url", stand_in_server,
+         "--requests", "20", "--concurrency", "2", "--output", str(output), "--max-p99-ms", str(max_p99_ms)],
+        capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == expected_code, result.stdout
+    report = json.loads(output.read_text())
+    assert report["succeeded"] == 20
+    assert set(report["payloads"]) == set(load_test.DEFAULT_PAYLOADS)
+    assert report["ready_after_s"] >= 0
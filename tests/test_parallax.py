@@ -0,0 +1,100 @@
+import pytest
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+PARALLAX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "orion_llm", "parallax")
+sys.path.insert(0, PARALLAX_DIR)
+
+import verify_weights
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+# --- Tests for verify_weights.py ---
+
+def test_merkle_root_uses_domain_separation_and_length(tmp_path):
+    """Test the merkle-sha256 definition on a small chunk size."""
+    chunks = [b"aaaa", b"bbbb", b"cc"]
+    path = write(tmp_path / "w.bin", b"".join(chunks))
+
+    leaves = [hashlib.sha256(b"\x00" + c).digest() for c in chunks]
+    left = hashlib.sha256(b"\x01" + leaves[0] + leaves[1]).digest()
+    root = hashlib.sha256(b"\x01" + left + leaves[2]).digest()
+    expected = hashlib.sha256(b"\x02" + (10).to_bytes(8, "big") + root).hexdigest()
+    assert verify_weights.merkle_sha256_file(path, chunk_bytes=4) == expected
+    assert verify_weights.merkle_sha256_file(path, chunk_bytes=4, workers=1) == expected
+
+    empty = write(tmp_path / "empty.bin", b"")
+    assert verify_weights.merkle_sha256_file(empty, chunk_bytes=4) != verify_weights.sha256_file(empty)
+
+def test_merkle_root_resists_inner_node_second_preimage(tmp_path):
+    """Test that a file made of two leaf digests does not share the root of their parent."""
+    chunks = [b"a" * 32, b"b" * 32]
+    original = write(tmp_path / "original.bin", b"".join(chunks))
+    leaves = [hashlib.sha256(b"\x00" + c).digest() for c in chunks]
+    forged = write(tmp_path / "forged.bin", leaves[0] + leaves[1])
+    assert os.path.getsize(forged) == os.path.getsize(original)
+
+    # Without prefixes, the forged file's single leaf would equal the original's inner node
+    assert verify_weights.merkle_sha256_file(forged, chunk_bytes=64) != verify_weights.merkle_sha256_file(original, chunk_bytes=32)
+
+def test_file_checksum_cache_keying(tmp_path, monkeypatch):
+    """Test that digests are cached per algorithm and path, and invalidated by changes."""
+    monkeypatch.setattr(verify_weights, "MERKLE_CHUNK_BYTES", 4)
+    cache_dir = str(tmp_path / "cache")
+    path = write(tmp_path / "w.bin", b"model weights")
+
+    digest, cached = verify_weights.file_checksum(path, "sha256", cache_dir)
+    assert (digest, cached) == (hashlib.sha256(b"model weights").hexdigest(), False)
+    assert verify_weights.file_checksum(path, "sha256", cache_dir) == (digest, True)
+
+    merkle, cached = verify_weights.file_checksum(path, "merkle-sha256", cache_dir)
+    assert not cached and merkle == verify_weights.merkle_sha256_file(path, chunk_bytes=4)
+    assert verify_weights.file_checksum(path, "merkle-sha256", cache_dir) == (merkle, True)
+
+    write(tmp_path / "w.bin", b"model weights, retrained")
+    digest, cached = verify_weights.file_checksum(path, "sha256", cache_dir)
+    assert not cached and digest == hashlib.sha256(b"model weights, retrained").hexdigest()
+
+    with open(os.path.join(cache_dir, "weights_checksums.json")) as f:
+        stored = json.load(f)
+    stored["version"] = verify_weights.CACHE_VERSION - 1
+    with open(os.path.join(cache_dir, "weights_checksums.json"), "w") as f:
+        json.dump(stored, f)
+    assert verify_weights.file_checksum(path, "sha256", cache_dir)[1] is False
+
+    with pytest.raises(ValueError):
+        verify_weights.file_checksum(path, "md5", cache_dir)
+
+def test_cache_dir_env_applies_to_in_process_callers(tmp_path, monkeypatch):
+    """Test that PARALLAX_CACHE_DIR is honoured without an explicit cache_dir."""
+    monkeypatch.setenv("PARALLAX_CACHE_DIR", str(tmp_path / "env_cache"))
+    path = write(tmp_path / "w.bin", b"model weights")
+    checksum = "sha256:" + hashlib.sha256(b"model weights").hexdigest()
+
+    assert verify_weights.verify(path, checksum) == (True, checksum, False)
+    assert verify_weights.verify(path, checksum) == (True, checksum, True)
+    assert os.path.exists(tmp_path / "env_cache" / "weights_checksums.json")
+    assert verify_weights.file_checksum(path, "sha256", "")[1] is False
+
+@pytest.mark.parametrize("tamper, expected_code", [(False, 0), (True, 1)])
+def test_register_exit_code_follows_checksum(tmp_path, tamper, expected_code):
+    """Test that `parallax register` fails on a weights checksum mismatch."""
+    weights = write(tmp_path / "tiny.ggml", b"tiny weights")
+    checksum = "sha256:" + hashlib.sha256(b"tiny weights").hexdigest()
+    if tamper:
+        write(tmp_path / "tiny.ggml", b"tampered weights")
+    manifest = tmp_path / "tiny.json"
+    manifest.write_text(json.dumps({"name": "tiny", "checksum": checksum}, indent=2))
+
+    result = subprocess.run(
+        [os.path.join(PARALLAX_DIR, "register"), "--manifest", str(manifest), "--weights", weights],
+        capture_output=True, text=True,
+        env={**os.environ, "PARALLAX_CACHE_DIR": str(tmp_path / "cache")},
+    )
+    assert result.returncode == expected_code
+    assert ("Registration successful" in result.stdout) == (not tamper)
@@ -2,10 +2,18 @@ import pytest
 import numpy as np
 import os
 import json
-from src.generate_waveform import generate_waveform
-from src.assign_plates import assign_plates
-from src.estimate_g2 import estimate_g2
-from src.match_rms import match_rms
+import subprocess
+import sys
+import tracemalloc
+from src.generate_waveform import generate_waveform, generate_waveform_bank, generate_waveform_blocks
+from src.assign_plates import assign_plates, assign_blocked_design
+from src.estimate_g2 import estimate_g2, estimate_cross_g2, G2Accumulator
+from src.match_rms import match_rms, match_rms_batch, save_qc_plots, closed_loop_rms, WindowedRMS
+from src.time_tags import estimate_g2_from_file, iter_time_tag_chunks, open_time_tags
+from src.photon_streams import photon_stream, iter_photon_chunks, ground_truth_g2
+from src.results_io import save_result, load_result
+from src import instrumentation
+from src.run_sweep import run_sweep, expand_spec, read_manifest
 
 # --- Constants for testing ---
 SAMPLING_RATE = 1000  # Use a lower rate for faster tests
@@ -34,6 +42,53 @@ def test_generate_waveform_output_properties():
     assert np.isclose(meta["final_rms"], target_rms, atol=1e-9)
     assert "calibration_factor" in meta
 
+def test_generate_waveform_out_buffer_and_dtype():
+    """Test writing into a preallocated buffer and the float32 option."""
+    reference, ref_meta = generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE)
+
+    buffer = np.empty(int(DURATION * SAMPLING_RATE))
+    waveform, meta = generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE, out=buffer)
+    assert waveform is buffer
+    assert np.array_equal(waveform, reference)
+    assert np.isclose(np.sqrt(np.mean(waveform**2)), meta["final_rms"], atol=1e-9)
+
+    single, _ = generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE, dtype=np.float32)
+    assert single.dtype == np.float32
+    assert np.allclose(single, reference, atol=1e-6)
+
+    with pytest.raises(ValueError):
+        generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE, out=np.empty(3))
+
+def test_generate_waveform_blocks_match_full_waveform():
+    """Test that streamed float32 blocks are phase-continuous and calibrated."""
+    waveform, _ = generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE)
+    blocks = list(generate_waveform_blocks(
+        duration=DURATION, sampling_rate=SAMPLING_RATE, block_size=32
+    ))
+
+    assert all(b.dtype == np.float32 for b in blocks)
+    assert max(len(b) for b in blocks) == 32
+    streamed = np.concatenate(blocks)
+    assert np.allclose(streamed, waveform, atol=1e-6)
+    assert np.isclose(np.sqrt(np.mean(streamed.astype(np.float64)**2)), 0.5, atol=1e-6)
+
+def test_generate_waveform_bank_matches_single_calls():
+    """Test that each bank row and metadata record matches a single call."""
+    frequencies = np.array([100.0, 250.0, 440.0])
+    phis = np.array([1.0, 1.5, 1.61803398875])
+    bank, meta = generate_waveform_bank(
+        frequencies, phis, target_rms=0.2, duration=DURATION, sampling_rate=SAMPLING_RATE
+    )
+
+    assert bank.shape == (3, int(DURATION * SAMPLING_RATE))
+    for row, record, freq, phi in zip(bank, meta, frequencies, phis):
+        waveform, single_meta = generate_waveform(
+            duration=DURATION, sampling_rate=SAMPLING_RATE, frequency=freq, phi=phi, target_rms=0.2
+        )
+        assert np.allclose(row, waveform, atol=1e-12)
+        assert np.isclose(record["calibration_factor"], single_meta["calibration_factor"])
+        assert np.isclose(record["final_rms"], 0.2)
+
 # --- Tests for assign_plates.py ---
 
 def test_assign_plates_balance_and_structure():
@@ -55,6 +110,37 @@ def test_assign_plates_reproducibility():
     assign2 = assign_plates(seed=123)
     assert json.dumps(assign1) == json.dumps(assign2)
 
+def test_assign_plates_seed_and_columnar_output():
+    """Test that the seed randomizes the square and columnar modes agree."""
+    arms = [f"arm_{i}" for i in range(6)]
+    records = assign_plates(num_plates=600, arms=arms, seed=1)
+    columns = assign_plates(num_plates=600, arms=arms, seed=1, output="columns")
+    table = assign_plates(num_plates=600, arms=arms, seed=1, output="structured")
+    other = assign_plates(num_plates=600, arms=arms, seed=2, output="columns")
+
+    assert [r["arm"] for r in records] == columns["arm"].tolist() == table["arm"].tolist()
+    assert [r["plate_id"] for r in records] == table["plate_id"].tolist()
+    assert not np.array_equal(columns["arm_index"], other["arm_index"])
+    assert np.all(np.bincount(columns["arm_index"], minlength=6) == 100)
+    # Every block of len(arms) consecutive plates is a permutation of the arms
+    assert np.all(np.sort(columns["arm_index"].reshape(-1, 6), axis=1) == np.arange(6))
+
+def test_assign_blocked_design_graeco_latin_balance():
+    """Test that a blocked design balances arms over every factor."""
+    arms = ["A", "B", "C", "D", "E"]
+    design, balance = assign_blocked_design(arms=arms, replicates=3, seed=7)
+
+    assert len(design["arm"]) == 3 * 5 * 5
+    assert set(balance) == {"batch", "day", "position"}
+    assert all(np.all(counts == 3) for counts in balance.values())
+    # Graeco-Latin: each (batch, position) and (day, position) pair once per replicate
+    for factor in ("batch", "day"):
+        pairs = np.bincount(design[factor] * 5 + design["position"], minlength=25)
+        assert np.all(pairs == 3)
+
+    with pytest.raises(ValueError):
+        assign_blocked_design(arms=["A", "B", "C", "D"])
+
 # --- Tests for estimate_g2.py ---
 
 def test_estimate_g2_no_photons():
@@ -81,6 +167,147 @@ def test_estimate_g2_output_shape():
     assert tau.shape == (expected_bins,)
     assert g2.shape == (expected_bins,)
 
+def test_estimate_g2_max_tau_below_bin_width():
+    """Test that max_tau < bin_width gives empty arrays, as the all-pairs version did."""
+    photons = np.array([0.1, 0.1 + 2e-10, 0.3])
+    kwargs = dict(bin_width=1e-9, max_tau=5e-10, duration=1.0)
+    for tau, g2 in (estimate_g2(photons, **kwargs), G2Accumulator(**kwargs).update(photons).result()):
+        assert tau.shape == (0,)
+        assert g2.shape == (0,)
+
+def test_estimate_g2_matches_all_pairs_histogram():
+    """Test the windowed engine against a brute-force all-pairs histogram."""
+    rng = np.random.default_rng(7)
+    photons = np.sort(rng.random(200) * 0.01)
+    max_tau = 1e-3
+    bin_width = 1e-4
+    tau, g2 = estimate_g2(photons, max_tau=max_tau, bin_width=bin_width, duration=0.01)
+
+    diffs = (photons[None, :] - photons[:, None])[np.triu_indices(len(photons), k=1)]
+    counts, _ = np.histogram(diffs, bins=np.linspace(0, max_tau, 11))
+    expected = counts / ((len(photons) / 0.01) * (len(photons) - 1) * bin_width)
+    assert np.array_equal(g2, expected)
+
+def test_estimate_g2_parallel_workers_match_serial():
+    """Test that segmenting across worker processes sums to the serial result."""
+    photons = photon_stream(0.01, rate=2e6, seed=13)
+    kwargs = dict(bin_width=1e-7, max_tau=5e-6, duration=0.01)
+    _, serial_g2 = estimate_g2(photons, **kwargs)
+    _, parallel_g2 = estimate_g2(photons, workers=3, **kwargs)
+    assert np.array_equal(serial_g2, parallel_g2)
+
+def test_g2_accumulator_matches_batch_estimate():
+    """Test that chunked accumulation counts pairs across chunk boundaries."""
+    photons = photon_stream(0.01, rate=5e5, seed=11)
+    kwargs = dict(bin_width=1e-6, max_tau=2e-5, duration=0.01)
+    tau, g2 = estimate_g2(photons, **kwargs)
+
+    chunks = (c for c in np.array_split(photons, 13))
+    acc_tau, acc_g2 = G2Accumulator(**kwargs).update_from(chunks).result()
+    assert np.array_equal(tau, acc_tau)
+    assert np.array_equal(g2, acc_g2)
+
+def test_estimate_g2_from_time_tag_file(tmp_path):
+    """Test g2 estimation from a memory-mapped picosecond file with channels."""
+    rng = np.random.default_rng(3)
+    tags_ps = np.sort(rng.integers(0, 10**10, size=4000)).astype("<i8")
+    channels = rng.integers(0, 2, size=tags_ps.size).astype("u1")
+    tag_path = tmp_path / "tags.bin"
+    tags_ps.tofile(tag_path)
+
+    kwargs = dict(bin_width=1e-6, max_tau=2e-5, duration=0.01)
+    selected = tags_ps[channels == 1]
+    tau, g2 = estimate_g2((selected - tags_ps[0]) * 1e-12, **kwargs)
+    file_tau, file_g2 = estimate_g2_from_file(
+        str(tag_path), unit="ps", chunk_size=512, channels=channels, channel=1, **kwargs
+    )
+    assert np.array_equal(tau, file_tau)
+    assert np.allclose(g2, file_g2)
+
+def test_estimate_g2_from_file_channel_file_dtype(tmp_path):
+    """Test a wide channel file through the top-level API, and channel without channels."""
+    tags = np.arange(0, 4000, dtype="<f8") * 1e-6
+    channels = np.tile(np.array([300, 301], dtype="<u2"), 2000)
+    tag_path, channel_path = tmp_path / "tags.bin", tmp_path / "channels.bin"
+    tags.tofile(tag_path)
+    channels.tofile(channel_path)
+
+    kwargs = dict(bin_width=1e-6, max_tau=1e-5, duration=0.004)
+    tau, g2 = estimate_g2(tags[channels == 301], **kwargs)
+    file_tau, file_g2 = estimate_g2_from_file(
+        str(tag_path), unit="s", channels=str(channel_path), channel=301, channel_dtype="<u2", **kwargs
+    )
+    assert np.array_equal(tau, file_tau)
+    assert np.array_equal(g2, file_g2)
+
+    with pytest.raises(ValueError):
+        estimate_g2_from_file(str(tag_path), unit="s", channel=301, **kwargs)
+
+def test_estimate_g2_from_empty_time_tag_file(tmp_path):
+    """Test that an empty tag file yields no chunks and no g2 estimate."""
+    tag_path = tmp_path / "empty.bin"
+    tag_path.write_bytes(b"")
+    channel_path = tmp_path / "empty_channels.bin"
+    channel_path.write_bytes(b"")
+
+    assert len(open_time_tags(str(tag_path))) == 0
+    assert list(iter_time_tag_chunks(str(tag_path), unit="s")) == []
+    assert estimate_g2_from_file(str(tag_path)) == (None, None)
+    assert estimate_g2_from_file(str(tag_path), channels=str(channel_path), channel=1) == (None, None)
+
+def test_estimate_cross_g2_symmetric_delays():
+    """Test the two-detector mode against brute-force delays of both signs."""
+    rng = np.random.default_rng(5)
+    times_a = np.sort(rng.random(300) * 0.01)
+    times_b = np.sort(rng.random(250) * 0.01)
+    tau, g2 = estimate_cross_g2(times_a, times_b, bin_width=1e-4, max_tau=1e-3, duration=0.01)
+
+    assert tau.shape == (21,)
+    assert tau[0] == -1e-3 and tau[10] == 0 and tau[-1] == 1e-3
+    diffs = (times_b[None, :] - times_a[:, None]).ravel()
+    counts, _ = np.histogram(diffs, bins=21, range=(-1.05e-3, 1.05e-3))
+    assert np.allclose(g2, counts / (300 * 250 * 1e-4 / 0.01))
+
+def test_estimate_cross_g2_max_tau_below_bin_width():
+    """Test that max_tau < bin_width gives empty arrays instead of dividing by zero."""
+    tau, g2 = estimate_cross_g2(np.array([0.1, 0.2]), np.array([0.1, 0.3]), bin_width=1e-9, max_tau=5e-10)
+    assert tau.shape == (0,)
+    assert g2.shape == (0,)
+
+# --- Tests for photon_streams.py ---
+
+@pytest.mark.parametrize("model, source", [
+    ("poisson", {"rate": 5e6}),
+    ("poisson", {"rate": 5e6, "dead_time": 20e-9}),
+    ("antibunched", {"rate": 2e7, "lifetime": 12e-9}),
+    ("thermal", {"rate": 5e6, "coherence_time": 10e-9}),
+])
+def test_photon_stream_matches_ground_truth_g2(model, source):
+    """Test that each synthetic source reproduces its closed-form g2."""
+    photons = photon_stream(0.1, model=model, efficiency=0.5, seed=1, **source)
+    assert np.all(np.diff(photons) >= 0)
+    assert photons[0] >= 0 and photons[-1] < 0.1
+
+    tau, g2 = estimate_g2(photons, bin_width=4e-9, max_tau=64e-9, duration=0.1)
+    expected = ground_truth_g2(tau, model=model, bin_width=4e-9, **source)
+    assert np.allclose(g2, expected, atol=0.06)
+
+def test_iter_photon_chunks_is_contiguous_and_seeded():
+    """Test chunked output against the whole stream and the accumulator."""
+    kwargs = dict(rate=1e6, model="thermal", seed=4)
+    chunks = list(iter_photon_chunks(0.01, chunk_size=1000, **kwargs))
+    assert len(chunks) > 5
+    assert all(a[-1] <= b[0] for a, b in zip(chunks, chunks[1:]))
+    assert np.array_equal(np.concatenate(chunks), photon_stream(0.01, chunk_size=1000, **kwargs))
+
+    g2_kwargs = dict(bin_width=1e-8, max_tau=1e-7, duration=0.01)
+    _, g2 = estimate_g2(np.concatenate(chunks), **g2_kwargs)
+    _, acc_g2 = G2Accumulator(**g2_kwargs).update_from(iter(chunks)).result()
+    assert np.array_equal(g2, acc_g2)
+
+    with pytest.raises(ValueError):
+        next(iter_photon_chunks(0.01, model="laser"))
+
 # --- Tests for match_rms.py ---
 
 def test_match_rms_output_shape():
@@ -91,6 +318,30 @@ def test_match_rms_output_shape():
     assert time.shape == (duration,)
     assert b_rms.shape == (duration,)
 
+def test_match_rms_batch_shapes_and_reproducibility():
+    """Test the Monte-Carlo batch mode and its summary statistics."""
+    time, traces, stats = match_rms_batch(target_rms=0.1, noise_level=0.001, duration=80, n_trials=500, seed=4)
+    _, traces_again, _ = match_rms_batch(target_rms=0.1, noise_level=0.001, duration=80, n_trials=500, seed=4)
+
+    assert time.shape == (80,)
+    assert traces.shape == (500, 80)
+    assert np.array_equal(traces, traces_again)
+    assert stats["settling_time"].shape == (500,)
+    assert np.all(stats["settled"] == (stats["settling_time"] < 80))
+    # With low noise the 5% band is reached once the 50% error has decayed
+    assert np.all(stats["settling_time"] >= 30)
+    assert abs(np.mean(stats["steady_state_error"])) < 0.005
+
+def test_match_rms_batch_zero_duration():
+    """Test that an empty batch returns empty traces like match_rms."""
+    time, traces, stats = match_rms_batch(target_rms=0.1, duration=0, n_trials=4, seed=0)
+
+    assert time.shape == (0,)
+    assert traces.shape == (4, 0)
+    assert np.array_equal(stats["settling_time"], np.zeros(4))
+    assert not stats["settled"].any()
+    assert np.isnan(stats["steady_state_error"]).all()
+
 def test_match_rms_qc_plot_generation():
     """Test if the QC plot is created."""
     plot_path = "results/magnetometer_rms_qc.png"
@@ -101,4 +352,151 @@ def test_match_rms_qc_plot_generation():
 
     assert os.path.exists(plot_path)
     # Clean up the created file
-    os.remove(plot_path)
\ No newline at end of file
+    os.remove(plot_path)
+
+def test_match_rms_import_does_not_load_matplotlib():
+    """Test that matplotlib is only imported once a QC plot is drawn."""
+    code = "import sys, src.match_rms; print('matplotlib' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "False"
+
+def test_save_qc_plots_batch(tmp_path):
+    """Test batched QC rendering writes one plot per trace."""
+    time, traces, _ = match_rms_batch(target_rms=0.1, duration=30, n_trials=3, seed=0)
+    paths = [str(tmp_path / f"qc_{i}.png") for i in range(3)]
+    assert save_qc_plots(time, traces, 0.1, paths) == paths
+    assert all(os.path.getsize(p) > 0 for p in paths)
+
+def test_windowed_rms_running_sum_matches_direct_rms():
+    """Test the running-sum estimate against the RMS of the last window samples."""
+    rng = np.random.default_rng(8)
+    estimator = WindowedRMS(window=100)
+    history = np.empty(0)
+    for size in [0, 7, 60, 100, 250, 33] * 40:
+        block = rng.normal(0, rng.uniform(0.1, 10), size)
+        history = np.concatenate((history, block))
+        expected = np.sqrt(np.mean(np.square(history[-100:]))) if history.size else 0.0
+        assert np.isclose(estimator.update(block), expected, rtol=1e-9)
+
+def test_closed_loop_rms_converges_and_saturates():
+    """Test the PI controller on real waveform blocks, with and without limits."""
+    def blocks():
+        return generate_waveform_blocks(duration=1.0, sampling_rate=48000, target_rms=1.0, block_size=1024)
+
+    steps = list(closed_loop_rms(blocks(), target_rms=0.1, window=2048))
+    assert len(steps) == 47
+    assert abs(steps[-1].measured_rms - 0.1) < 1e-3
+
+    limited = list(closed_loop_rms(blocks(), target_rms=0.1, gain_limits=(0.5, 2.0)))
+    assert all(0.5 <= s.gain <= 2.0 for s in limited[1:])
+    assert limited[-1].saturated
+
+    unbounded = list(closed_loop_rms(blocks(), target_rms=0.1, window=2048, gain_limits=(None, None)))
+    assert not any(s.saturated for s in unbounded)
+    assert abs(unbounded[-1].measured_rms - 0.1) < 1e-3
+
+    upper_only = list(closed_loop_rms(blocks(), target_rms=2.0, gain_limits=(None, 1.5)))
+    assert all(s.gain <= 1.5 for s in upper_only)
+    assert upper_only[-1].saturated
+
+# --- Tests for results_io.py ---
+
+def test_results_round_trip_with_memory_map(tmp_path):
+    """Test saving arrays with a metadata sidecar and memory-mapped reads."""
+    waveform, meta = generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE)
+    output_dir = str(tmp_path / "results")
+    path = save_result(output_dir, "waveform", waveform, meta)
+    assert path.endswith("waveform.npy")
+
+    loaded, loaded_meta = load_result(output_dir, "waveform")
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, waveform)
+    assert loaded_meta["calibration_factor"] == meta["calibration_factor"]
+
+    save_result(output_dir, "curves", {"tau_s": np.arange(3.0), "g2": np.ones(3)})
+    curves, curves_meta = load_result(output_dir, "curves")
+    assert set(curves) == {"tau_s", "g2"}
+    assert curves_meta is None
+
+# --- Tests for instrumentation.py ---
+
+def test_instrumentation_records_stages_and_exports(tmp_path):
+    """Test stage records, the disabled no-op path and the trace/profile exports."""
+    photons = np.sort(np.random.default_rng(0).random(2000) * 1e-3)
+
+    instrumentation.reset()
+    estimate_g2(photons, bin_width=1e-9, max_tau=20e-9, duration=1e-3)
+    assert instrumentation.records() == []
+
+    trace_path = str(tmp_path / "trace.json")
+    profile_path = str(tmp_path / "run.prof")
+    with instrumentation.session(trace_path, profile_path):
+        estimate_g2(photons, bin_width=1e-9, max_tau=20e-9, duration=1e-3)
+        generate_waveform(duration=DURATION, sampling_rate=SAMPLING_RATE)
+    assert not instrumentation.is_enabled()
+
+    names = [record["name"] for record in instrumentation.records()]
+    assert names[:3] == ["estimate_g2.sort", "estimate_g2.histogram", "estimate_g2.normalize"]
+    assert {"generate_waveform.phase", "generate_waveform.render", "generate_waveform.calibrate"} <= set(names)
+    assert instrumentation.summary()["estimate_g2.histogram"]["calls"] == 1
+
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    assert events[1]["args"]["photons"] == 2000
+    assert os.path.getsize(profile_path) > 0
+    instrumentation.reset()
+
+def test_instrumentation_leaves_caller_tracemalloc_running(tmp_path):
+    """Test that sessions stop tracemalloc only when they started it."""
+    tracemalloc.start()
+    try:
+        with instrumentation.session(str(tmp_path / "trace.json"), trace_memory=True):
+            pass
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+    with instrumentation.session(str(tmp_path / "trace.json"), trace_memory=True):
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    instrumentation.reset()
+
+def test_assign_plates_logs_balance(caplog):
+    """Test that the balance check goes through logging rather than print."""
+    with caplog.at_level("INFO", logger="src.assign_plates"):
+        assign_plates(num_plates=7, arms=["A", "B", "C"])
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Arm balance check") for message in messages)
+    assert caplog.records[-1].levelname == "WARNING"
+
+# --- Tests for run_sweep.py ---
+
+def test_run_sweep_writes_points_and_resumes(tmp_path):
+    """Test a grid sweep over a process pool, then a resumed run that skips finished points."""
+    spec = {
+        "experiments": {
+            "waveform": {"duration": DURATION, "sampling_rate": SAMPLING_RATE, "frequency": [100.0, 200.0]},
+            "g2": {"duration": 1e-3, "rate": 1e6, "max_tau": 20e-9, "seed": 0},
+            "plates": {"num_plates": [6, 9], "arms": [["A", "B", "C"]]},
+        },
+    }
+    output_dir = str(tmp_path / "sweep")
+    points = expand_spec(spec)
+    assert len(points) == 5
+    assert len({name for name, _, _ in points}) == 5
+
+    report = run_sweep(spec, output_dir, workers=2)
+    assert report["failed"] == {}
+    assert sorted(report["completed"]) == sorted(name for name, _, _ in points)
+    assert set(read_manifest(output_dir)) == set(report["completed"])
+
+    name = next(name for name, experiment, _ in points if experiment == "plates")
+    table, meta = load_result(output_dir, name)
+    assert meta["sweep"]["experiment"] == "plates"
+    assert len(table) == meta["sweep"]["params"]["num_plates"]
+
+    spec["experiments"]["waveform"]["frequency"].append(300.0)
+    resumed = run_sweep(spec, output_dir, workers=1)
+    assert len(resumed["skipped"]) == 5
+    assert len(resumed["completed"]) == 1
@@ -0,0 +1,131 @@
+import pytest
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "orion_llm"))
+
+from run_simulation import ManagedProcess, Step, run_pipeline
+
+# --- Tests for run_pipeline ---
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """Builds the simulation's step graph from fake callables that log their runs."""
+    monkeypatch.setenv("PARALLAX_CACHE_DIR", str(tmp_path / "cache"))
+    weights = tmp_path / "weights.bin"
+    weights.write_bytes(b"weights v1")
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text('{"checksum": "v1"}')
+    ran = []
+
+    def fake(name):
+        def run(deps):
+            ran.append(name)
+            return {"step": name, "deps": sorted(deps)}
+        return run
+
+    def build(prompt="hello"):
+        ran.clear()
+        return [
+            Step("verify", fake("verify"), inputs=[str(manifest), str(weights)]),
+            Step("register", fake("register"), deps=["verify"]),
+            Step("serve", fake("serve"), deps=["verify"], cacheable=False),
+            Step("query", fake("query"), deps=["register", "serve"], params={"prompt": prompt}),
+        ]
+
+    build.ran = ran
+    build.state_path = str(tmp_path / "state.json")
+    build.weights = weights
+    build.manifest = manifest
+    return build
+
+def test_run_pipeline_skips_unchanged_steps(pipeline):
+    """Test that a second run reuses every output and leaves serve stopped."""
+    outputs = run_pipeline(pipeline(), state_path=pipeline.state_path)
+    assert sorted(pipeline.ran) == ["query", "register", "serve", "verify"]
+    assert outputs["query"] == {"step": "query", "deps": ["register", "serve"]}
+
+    again = run_pipeline(pipeline(), state_path=pipeline.state_path)
+    assert pipeline.ran == []
+    assert again["query"] == outputs["query"]
+    assert again["serve"] is None
+
+@pytest.mark.parametrize("change", ["weights", "manifest"])
+def test_run_pipeline_reruns_steps_downstream_of_changed_inputs(pipeline, change):
+    """Test that editing an input file invalidates the step and everything after it."""
+    run_pipeline(pipeline(), state_path=pipeline.state_path)
+    if change == "weights":
+        pipeline.weights.write_bytes(b"weights v2, retrained")
+    else:
+        pipeline.manifest.write_text('{"checksum": "v2, retrained"}')
+
+    run_pipeline(pipeline(), state_path=pipeline.state_path)
+    assert sorted(pipeline.ran) == ["query", "register", "serve", "verify"]
+
+def test_run_pipeline_starts_serve_only_for_steps_that_must_run(pipeline):
+    """Test that a changed downstream step brings up its non-cacheable dependency."""
+    run_pipeline(pipeline(), state_path=pipeline.state_path)
+
+    run_pipeline(pipeline(prompt="goodbye"), state_path=pipeline.state_path)
+    assert sorted(pipeline.ran) == ["query", "serve"]
+
+def test_run_pipeline_force_reruns_everything(pipeline):
+    """Test that force ignores the recorded state."""
+    run_pipeline(pipeline(), state_path=pipeline.state_path)
+
+    run_pipeline(pipeline(), state_path=pipeline.state_path, force=True)
+    assert sorted(pipeline.ran) == ["query", "register", "serve", "verify"]
+
+def test_run_pipeline_overlaps_independent_steps(tmp_path):
+    """Test that steps sharing only a finished dependency run at the same time."""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def meet(_):
+        barrier.wait()  # raises BrokenBarrierError unless both run concurrently
+        return True
+
+    steps = [
+        Step("root", lambda _: True),
+        Step("left", meet, deps=["root"]),
+        Step("right", meet, deps=["root"]),
+    ]
+    outputs = run_pipeline(steps, state_path=str(tmp_path / "state.json"))
+    assert outputs == {"root": True, "left": True, "right": True}
+
+@pytest.mark.parametrize("steps", [
+    [Step("a", None, deps=["b"]), Step("b", None, deps=["a"])],
+    [Step("a", None, deps=["missing"])],
+])
+def test_run_pipeline_rejects_cycles_and_unknown_dependencies(tmp_path, steps):
+    """Test that a malformed graph is rejected before any step runs."""
+    with pytest.raises(ValueError):
+        run_pipeline(steps, state_path=str(tmp_path / "state.json"))
+
+# --- Tests for ManagedProcess ---
+
+def test_managed_process_times_out_on_silent_process():
+    """Test that the readiness timeout holds even when the process prints nothing."""
+    process = ManagedProcess(["sh", "-c", "sleep 8; echo ready"], "ready", timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(RuntimeError):
+        process.start()
+    assert time.monotonic() - start < 3.0
+    assert process.process.poll() is not None
+
+def test_managed_process_fails_fast_when_process_exits():
+    """Test that an exit before the marker is reported without waiting out the timeout."""
+    process = ManagedProcess(["sh", "-c", "echo starting"], "ready", timeout=10.0)
+    start = time.monotonic()
+    with pytest.raises(RuntimeError):
+        process.start()
+    assert time.monotonic() - start < 3.0
+
+def test_managed_process_keeps_draining_output_after_ready(capsys):
+    """Test that output after the ready marker is forwarded, so the pipe never fills."""
+    script = "echo ready; i=0; while [ $i -lt 4000 ]; do echo log line $i padded to fill the pipe buffer; i=$((i+1)); done"
+    process = ManagedProcess(["sh", "-c", script], "ready", timeout=5.0).start()
+    assert process.process.wait(timeout=10) == 0
+    process.stop()
+    assert "log line 3999" in capsys.readouterr().out